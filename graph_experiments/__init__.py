@@ -1,6 +1,24 @@
 from . import constants
-from .types import Node, KeySpace, GraphArgs, StrategyArgs, TestArgs
+from .types import (
+    Node,
+    KeySpace,
+    GraphArgs,
+    StrategyArgs,
+    TestArgs,
+    ChurnArgs,
+)
+from .key_space import (
+    create_from_keys,
+    random_key_data,
+    KeySpaceGenerator,
+)
+from .spatial_index import SpatialIndex
 from .distance import Distance
+from .graph import Graph
 from .neighbour_strategy import NeighbourStrategy
 from .test_strategy import TestStrategy
+from .adversary import Adversary
+from .latency import Latency
+from .graph_search import GraphSearch
 from .tester import ConnectednessResults, test_nodes
+from .cache import ResultCache, GraphSnapshots
@@ -15,25 +15,95 @@ run:
     --num-nodes 10 20 30 40 50
     --neighbour-strategy random closest \
     --test-strategy all-knowing
+
+Each combination of arguments is a separate "cell" of the sweep. Cells can be
+run in parallel processes with `--jobs`, and are seeded from `--seed` so that
+results are reproducible regardless of the number of jobs. Node positions are
+generated from the seed by a counter-based generator, so they don't depend on
+anything else that uses the random state. With `--cache-directory`, the
+results of each cell are cached on disk, so that re-running a sweep with the
+same `--seed` only runs cells that have changed.
+With `--snapshot-directory`, the graph built for each cell is saved, so that
+re-testing it (e.g. with a different `--search`) doesn't rebuild it.
+
+With `--profile`, the time taken by each phase of each cell (building the
+graph, testing it, etc.) and counts of the operations made in each phase are
+written as JSON next to the output, e.g. to `output.profile.json`. With
+`--cprofile-directory`, each cell is also run under `cProfile`, and its stats
+are written to that directory.
+
+To see how searches scale, `--num-nodes-geomspace START STOP NUM` (and the
+same for `--key-space-dimensions` and `--max-neighbours`) sweeps exponentially
+spaced values. `--fit-scaling` then fits the mean number of requests against
+the number of nodes for each strategy, dimensions and neighbours, and
+extrapolates the fits to `--predict-num-nodes`.
+
+By default, each graph is tested with best-first searches between a sample of
+node pairs. `--search greedy` instead runs greedy searches in vectorized
+batches, which is fast enough to search between all pairs with `--all-pairs`.
+With `--success-interval-width` and/or `--mean-interval-width`, searches stop
+early once the 95% confidence intervals of the success rate and/or the mean
+number of requests are that narrow, up to `--num-search-tests` searches.
+
+`--search graph-search` models the daemon's search, limited by
+`--search-breadth`. With `--malicious-fraction`, that fraction of nodes respond
+to its queries as the `--adversary` does. `python -m
+graph_experiments.resilience` sweeps the fraction of malicious nodes. With
+`--latency` (e.g. "lognormal:0.05,0.5"), each query takes a random time, up to
+`--max-num-search-threads` queries run at once, and the mean time taken by
+successful searches is reported.
+
+By default, results are plotted to `output.png`. With `--output-format csv`,
+`jsonl` or `parquet`, nothing is plotted, and instead the results of each cell
+are written as a row as soon as the cell finishes, e.g. to `output.csv`, so
+that long sweeps can be followed while they run. Rows are written in the order
+cells finish, and include each cell's arguments and seed. `parquet` requires
+`pyarrow`, and can only be read once the sweep has finished.
 """
 
+import hashlib
+import json
+import random
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
 from itertools import product
+from pathlib import Path
+from typing import Optional, List, Tuple, Dict, Any, Iterator
 
-import matplotlib.pyplot as plt
+import numpy as np
 
 from graph_experiments import (
     GraphArgs,
     TestStrategy,
     NeighbourStrategy,
-    KeySpace,
-    Node,
+    Graph,
     Distance,
     StrategyArgs,
     TestArgs,
+    ResultCache,
+    GraphSnapshots,
+    KeySpaceGenerator,
 )
+from graph_experiments.graph_search import (
+    SEARCH_BREADTH,
+    MAX_NUM_SEARCH_THREADS,
+    SEARCH_TIMEOUT_SEC,
+)
+from graph_experiments.cache import code_version
+from graph_experiments.output import ResultWriter, get_row
+from graph_experiments.profiling import Profile
+from graph_experiments.scaling import fit_scaling
 from graph_experiments.tester import ConnectednessResults, test_nodes
 
+OUTPUT_EXTENSIONS = {
+    "plot": "png",
+    "csv": "csv",
+    "jsonl": "jsonl",
+    "parquet": "parquet",
+}
+"""The file extension of the default output path for each output format."""
+
 
 def main():
     parser = ArgumentParser("graph_experiments")
@@ -49,8 +119,61 @@ def main():
     parser.add_argument("--max-neighbours", type=int, default=[10], nargs="+")
     parser.add_argument("--num-search-tests", type=int, default=100)
     parser.add_argument("--num-graph-tests", type=int, default=1)
-    parser.add_argument("--output-path", type=str, default="output.png")
+    parser.add_argument(
+        "--search",
+        type=str,
+        choices=["best-first", "greedy", "graph-search"],
+        default="best-first",
+    )
+    parser.add_argument("--search-breadth", type=int, default=SEARCH_BREADTH)
+    parser.add_argument(
+        "--max-num-search-threads", type=int, default=MAX_NUM_SEARCH_THREADS
+    )
+    parser.add_argument(
+        "--search-timeout-sec", type=float, default=SEARCH_TIMEOUT_SEC
+    )
+    parser.add_argument("--latency", type=str, default=None)
+    parser.add_argument("--malicious-fraction", type=float, default=0)
+    parser.add_argument(
+        "--adversary",
+        type=str,
+        choices=["black-hole", "random-response", "random-nodes"],
+        default="black-hole",
+    )
+    parser.add_argument("--all-pairs", action="store_true")
+    parser.add_argument("--success-interval-width", type=float, default=None)
+    parser.add_argument("--mean-interval-width", type=float, default=None)
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        choices=list(OUTPUT_EXTENSIONS),
+        default="plot",
+    )
+    # Defaults to "output" with the extension of `--output-format`
+    parser.add_argument("--output-path", type=str, default=None)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--cache-directory", type=str, default=None)
+    parser.add_argument("--snapshot-directory", type=str, default=None)
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--cprofile-directory", type=str, default=None)
+    for name in ["num-nodes", "key-space-dimensions", "max-neighbours"]:
+        parser.add_argument(
+            f"--{name}-geomspace",
+            type=int,
+            nargs=3,
+            default=None,
+            metavar=("START", "STOP", "NUM"),
+        )
+    parser.add_argument("--fit-scaling", action="store_true")
+    parser.add_argument(
+        "--predict-num-nodes", type=int, default=[10**7], nargs="+"
+    )
     parser_args = parser.parse_args()
+    for name in ["num_nodes", "key_space_dimensions", "max_neighbours"]:
+        geomspace = getattr(parser_args, f"{name}_geomspace")
+        if geomspace is not None:
+            setattr(parser_args, name, __geomspace(*geomspace))
 
     all_strategy_args = [
         StrategyArgs(*args)
@@ -71,47 +194,402 @@ def main():
     ]
 
     test_args = TestArgs(
-        parser_args.num_search_tests, parser_args.num_graph_tests
+        parser_args.num_search_tests,
+        parser_args.num_graph_tests,
+        parser_args.search,
+        parser_args.all_pairs,
+        parser_args.success_interval_width,
+        parser_args.mean_interval_width,
+        parser_args.search_breadth,
+        parser_args.malicious_fraction,
+        parser_args.adversary,
+        parser_args.max_num_search_threads,
+        parser_args.search_timeout_sec,
+        parser_args.latency,
     )
 
-    for strategy_args in all_strategy_args:
-        results = [
-            run(strategy_args, graph_args, test_args)
-            for graph_args in all_graph_args
-        ]
-        plt.plot([r.mean_num_requests for r in results])
+    cells = list(product(all_strategy_args, all_graph_args))
+    seeds = __get_seeds(parser_args.seed, cells)
+    cache = (
+        ResultCache(Path(parser_args.cache_directory))
+        if parser_args.cache_directory is not None
+        else None
+    )
+    snapshots = (
+        GraphSnapshots(Path(parser_args.snapshot_directory))
+        if parser_args.snapshot_directory is not None
+        else None
+    )
+    output_path = (
+        parser_args.output_path
+        if parser_args.output_path is not None
+        else f"output.{OUTPUT_EXTENSIONS[parser_args.output_format]}"
+    )
 
-    plt.xticks(list(range(len(all_graph_args))), all_graph_args, rotation=45)
-    plt.legend(all_strategy_args)
-    plt.savefig(parser_args.output_path)
-    plt.show()
+    cells_results: List[
+        Optional[Tuple[ConnectednessResults, Optional[Dict[str, Any]]]]
+    ] = [None] * len(cells)
+    num_printed = 0
+    # The strategies' classes don't depend on the graph arguments, so they're
+    # only resolved once for each `StrategyArgs`
+    class_names = {
+        strategy_args: __get_class_names(strategy_args, all_graph_args[0])
+        for strategy_args in all_strategy_args
+    }
+    with ExitStack() as stack:
+        executor = (
+            stack.enter_context(
+                ProcessPoolExecutor(max_workers=parser_args.jobs)
+            )
+            if parser_args.jobs > 1
+            else None
+        )
+        writer = (
+            ResultWriter.get(parser_args.output_format, Path(output_path))
+            if parser_args.output_format != "plot"
+            else None
+        )
+        if writer is not None:
+            stack.callback(writer.close)
+        for index, cell_results in __run_cells(
+            cells,
+            seeds,
+            executor,
+            test_args,
+            cache,
+            snapshots,
+            parser_args.cprofile_directory,
+            parser_args.profile,
+        ):
+            strategy_args, graph_args = cells[index]
+            if writer is not None:
+                writer.write(
+                    get_row(
+                        strategy_args,
+                        graph_args,
+                        seeds[index],
+                        cell_results[0],
+                    )
+                )
+            cells_results[index] = cell_results
+            # Cells can finish in any order, but are printed in the order of
+            # `cells`, so output is the same regardless of the number of jobs
+            while (
+                num_printed < len(cells)
+                and cells_results[num_printed] is not None
+            ):
+                strategy_args, graph_args = cells[num_printed]
+                __print_results(
+                    class_names[strategy_args],
+                    graph_args,
+                    cells_results[num_printed][0],
+                )
+                num_printed += 1
+
+    results_by_strategy = {
+        strategy_args: [] for strategy_args in all_strategy_args
+    }
+    cell_profiles = []
+    for (strategy_args, graph_args), seed, (results, profile) in zip(
+        cells, seeds, cells_results
+    ):
+        results_by_strategy[strategy_args].append(results)
+        cell_profiles.append(
+            {
+                "strategy_args": strategy_args._asdict(),
+                "graph_args": graph_args._asdict(),
+                "seed": seed,
+                "cached": profile is None,
+                **(profile or {}),
+            }
+        )
+
+    if parser_args.profile:
+        profile_path = Path(output_path).with_suffix(".profile.json")
+        with open(str(profile_path), "w") as file:
+            json.dump(
+                {
+                    "code_version": code_version(),
+                    "test_args": test_args._asdict(),
+                    "cells": cell_profiles,
+                },
+                file,
+                indent=2,
+            )
+
+    if parser_args.fit_scaling:
+        for strategy_args in all_strategy_args:
+            __print_scaling(
+                strategy_args,
+                all_graph_args,
+                results_by_strategy[strategy_args],
+                parser_args.predict_num_nodes,
+            )
+
+    if parser_args.output_format == "plot":
+        __plot(
+            all_strategy_args, all_graph_args, results_by_strategy, output_path
+        )
 
 
 def run(
-    strategy_args: StrategyArgs, graph_args: GraphArgs, test_args: TestArgs
+    strategy_args: StrategyArgs,
+    graph_args: GraphArgs,
+    test_args: TestArgs,
+    seed: Optional[int] = None,
+    snapshots: Optional[GraphSnapshots] = None,
+    profile: Optional[Profile] = None,
 ) -> ConnectednessResults:
+    # Building and testing the graph are seeded separately, so that tests are
+    # the same whether the graph is built or loaded from a snapshot
+    graph_seed, test_seed = (
+        np.random.SeedSequence(seed).generate_state(2).tolist()
+        if seed is not None
+        else (None, None)
+    )
+
     distance = Distance.get(strategy_args.distance_name, graph_args)
     neighbour_strategy = NeighbourStrategy.get(
         strategy_args.neighbour_strategy_name, distance, graph_args
     )
     test_strategy = TestStrategy.get(strategy_args.test_strategy_name)
 
-    nodes = frozenset(
-        Node(i, KeySpace.random(graph_args.key_space_dimensions))
-        for i in range(graph_args.num_nodes)
+    if profile is None:
+        profile = Profile()
+
+    graph = None
+    if snapshots is not None and seed is not None:
+        with profile.phase("load"):
+            graph = snapshots.get(strategy_args, graph_args, seed)
+    if graph is None:
+        __seed(graph_seed)
+        generator = (
+            KeySpaceGenerator(graph_seed, graph_args.key_space_dimensions)
+            if graph_seed is not None
+            else None
+        )
+        with profile.phase("generate"):
+            graph = Graph.random(graph_args, distance, generator)
+        with profile.phase("build"):
+            graph = test_strategy.apply(graph, neighbour_strategy)
+        if snapshots is not None and seed is not None:
+            with profile.phase("save"):
+                snapshots.put(strategy_args, graph_args, seed, graph)
+
+    __seed(test_seed)
+    with profile.phase("test"):
+        return test_nodes(graph, distance, test_args)
+
+
+def __seed(seed: Optional[int]) -> None:
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+
+
+def __run_cells(
+    cells: List[Tuple[StrategyArgs, GraphArgs]],
+    seeds: List[int],
+    executor: Optional[ProcessPoolExecutor],
+    test_args: TestArgs,
+    cache: Optional[ResultCache],
+    snapshots: Optional[GraphSnapshots],
+    cprofile_directory: Optional[str],
+    count_operations: bool,
+) -> Iterator[
+    Tuple[int, Tuple[ConnectednessResults, Optional[Dict[str, Any]]]]
+]:
+    """
+    Runs each cell, yielding the index of each cell and what `__run_cached`
+    returns for it as soon as the cell finishes.
+    """
+    if executor is None:
+        for index, ((strategy_args, graph_args), seed) in enumerate(
+            zip(cells, seeds)
+        ):
+            yield index, __run_cached(
+                strategy_args,
+                graph_args,
+                test_args,
+                seed,
+                cache,
+                snapshots,
+                cprofile_directory,
+                count_operations,
+            )
+        return
+
+    futures = {
+        executor.submit(
+            __run_cached,
+            strategy_args,
+            graph_args,
+            test_args,
+            seed,
+            cache,
+            snapshots,
+            cprofile_directory,
+            count_operations,
+        ): index
+        for index, ((strategy_args, graph_args), seed) in enumerate(
+            zip(cells, seeds)
+        )
+    }
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+
+def __run_cached(
+    strategy_args: StrategyArgs,
+    graph_args: GraphArgs,
+    test_args: TestArgs,
+    seed: int,
+    cache: Optional[ResultCache],
+    snapshots: Optional[GraphSnapshots],
+    cprofile_directory: Optional[str],
+    count_operations: bool,
+) -> Tuple[ConnectednessResults, Optional[Dict[str, Any]]]:
+    """
+    Runs a cell, returning its results and its profile, or `None` for the
+    profile if the results were cached.
+    """
+    if cache is not None:
+        results = cache.get(strategy_args, graph_args, test_args, seed)
+        if results is not None:
+            return results, None
+
+    profile = Profile(
+        (
+            Path(cprofile_directory) / f"{strategy_args}_{graph_args}.prof"
+            if cprofile_directory is not None
+            else None
+        ),
+        count_operations,
+    )
+    results = run(
+        strategy_args, graph_args, test_args, seed, snapshots, profile
     )
-    nodes = test_strategy.apply(nodes, neighbour_strategy)
+    profile.dump()
+    if cache is not None:
+        cache.put(strategy_args, graph_args, test_args, seed, results)
+    return results, profile.to_json()
 
-    results = test_nodes(nodes, distance, test_args)
-    print(
+
+def __get_seeds(
+    seed: Optional[int], cells: List[Tuple[StrategyArgs, GraphArgs]]
+) -> List[int]:
+    """
+    Derives an independent seed for each cell from a single seed, picking one
+    at random if no seed is given.
+
+    Each cell's seed only depends on the cell's arguments, so adding cells to
+    a sweep doesn't change the seeds of the existing cells.
+    """
+    if seed is None:
+        seed = random.randrange(2**32)
+    cell_seeds = []
+    for cell in cells:
+        cell_hash = hashlib.sha256(json.dumps(cell).encode()).digest()
+        cell_entropy = [seed, *np.frombuffer(cell_hash, dtype=np.uint32)]
+        cell_seeds.append(
+            int(np.random.SeedSequence(cell_entropy).generate_state(1)[0])
+        )
+    return cell_seeds
+
+
+def __geomspace(start: int, stop: int, num: int) -> List[int]:
+    """
+    Gets up to `num` exponentially spaced integers from `start` to `stop`,
+    skipping any that are the same after rounding.
+    """
+    return sorted(
+        set(np.round(np.geomspace(start, stop, num)).astype(int).tolist())
+    )
+
+
+def __print_scaling(
+    strategy_args: StrategyArgs,
+    all_graph_args: List[GraphArgs],
+    all_results: List[ConnectednessResults],
+    predict_num_nodes: List[int],
+) -> None:
+    for key_space_dimensions, max_neighbours in sorted(
+        {(a.key_space_dimensions, a.max_neighbours) for a in all_graph_args}
+    ):
+        cells = [
+            (graph_args.num_nodes, results.mean_num_requests)
+            for graph_args, results in zip(all_graph_args, all_results)
+            if graph_args.key_space_dimensions == key_space_dimensions
+            and graph_args.max_neighbours == max_neighbours
+        ]
+        fits = fit_scaling(
+            [num_nodes for num_nodes, _ in cells],
+            [mean_num_requests for _, mean_num_requests in cells],
+            key_space_dimensions,
+            max_neighbours,
+            predict_num_nodes,
+        )
+        for fit in fits:
+            print(
+                strategy_args,
+                f"e={max_neighbours},d={key_space_dimensions}",
+                fit,
+                sep="\t",
+                flush=True,
+            )
+
+
+def __plot(
+    all_strategy_args: List[StrategyArgs],
+    all_graph_args: List[GraphArgs],
+    results_by_strategy: Dict[StrategyArgs, List[ConnectednessResults]],
+    output_path: str,
+) -> None:
+    # Imported here as importing `matplotlib` is slow, and isn't needed when
+    # results are only written to a file
+    import matplotlib.pyplot as plt
+
+    for strategy_args in all_strategy_args:
+        results = results_by_strategy[strategy_args]
+        plt.plot([r.mean_num_requests for r in results])
+
+    plt.xticks(list(range(len(all_graph_args))), all_graph_args, rotation=45)
+    plt.legend(all_strategy_args)
+    plt.savefig(output_path)
+    plt.show()
+
+
+def __get_class_names(
+    strategy_args: StrategyArgs, graph_args: GraphArgs
+) -> Tuple[str, str, str]:
+    """
+    Gets the class names of the neighbour strategy, distance and test strategy
+    of `strategy_args`, which are printed with each cell's results.
+    """
+    distance = Distance.get(strategy_args.distance_name, graph_args)
+    neighbour_strategy = NeighbourStrategy.get(
+        strategy_args.neighbour_strategy_name, distance, graph_args
+    )
+    test_strategy = TestStrategy.get(strategy_args.test_strategy_name)
+    return (
         type(neighbour_strategy).__name__,
         type(distance).__name__,
         type(test_strategy).__name__,
+    )
+
+
+def __print_results(
+    class_names: Tuple[str, str, str],
+    graph_args: GraphArgs,
+    results: ConnectednessResults,
+) -> None:
+    print(
+        *class_names,
         graph_args,
         results,
         sep="\t",
+        flush=True,
     )
-    return results
 
 
 if __name__ == "__main__":
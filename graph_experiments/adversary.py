@@ -0,0 +1,107 @@
+import random
+from abc import ABC, abstractmethod
+from typing import Tuple
+
+import numpy as np
+
+from graph_experiments import Graph, Distance
+from graph_experiments.graph import NO_NEIGHBOUR
+
+RANDOM_RESPONSE_MAX_NODES = 10
+"""
+Matches the number of nodes returned by the daemon's
+`RandomResponsePayloadHandler`, which is less than this.
+"""
+
+
+class Adversary(ABC):
+    """
+    How malicious nodes respond to queries during a search.
+    """
+
+    def __init__(self, distance: Distance):
+        self.distance = distance
+
+    @classmethod
+    def get(cls, name: str, distance: Distance) -> "Adversary":
+        if name == "black-hole":
+            return BlackHole(distance)
+        elif name == "random-response":
+            return RandomResponse(distance)
+        elif name == "random-nodes":
+            return RandomNodes(distance)
+        else:
+            raise AssertionError(f"Unknown adversary: {name}")
+
+    @abstractmethod
+    def respond(
+        self,
+        graph: Graph,
+        index: int,
+        key_position: np.ndarray,
+        num_nodes: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the response of the malicious node `index` to a query for
+        `key_position`, where an honest node would return `num_nodes` nodes.
+
+        Returns the indices and positions of the returned nodes. Fake nodes
+        that aren't in the graph have an index of `NO_NEIGHBOUR`.
+        """
+        raise NotImplementedError()
+
+
+class BlackHole(Adversary):
+    """
+    Never returns any nodes, as the daemon's `BlackHolePayloadHandler` does.
+    """
+
+    def respond(
+        self,
+        graph: Graph,
+        index: int,
+        key_position: np.ndarray,
+        num_nodes: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        return (
+            np.empty(0, dtype=np.int32),
+            np.empty((0, graph.positions.shape[1])),
+        )
+
+
+class RandomResponse(Adversary):
+    """
+    Returns a random number of fake nodes at random positions, as the daemon's
+    `RandomResponsePayloadHandler` does. Fake nodes don't respond to queries.
+    """
+
+    def respond(
+        self,
+        graph: Graph,
+        index: int,
+        key_position: np.ndarray,
+        num_nodes: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        num_fake_nodes = random.randrange(RANDOM_RESPONSE_MAX_NODES)
+        return (
+            np.full(num_fake_nodes, NO_NEIGHBOUR, dtype=np.int32),
+            self.distance.random_positions(num_fake_nodes),
+        )
+
+
+class RandomNodes(Adversary):
+    """
+    Returns real nodes picked at random from the whole network, which are far
+    from the key on average. Unlike fake nodes, these look like honest
+    responses, and the returned nodes respond to queries.
+    """
+
+    def respond(
+        self,
+        graph: Graph,
+        index: int,
+        key_position: np.ndarray,
+        num_nodes: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        indices = np.random.randint(len(graph), size=num_nodes)
+        return indices.astype(np.int32), graph.positions[indices]
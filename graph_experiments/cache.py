@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional, List, Any
+
+from graph_experiments import (
+    StrategyArgs,
+    GraphArgs,
+    TestArgs,
+    ConnectednessResults,
+    Graph,
+)
+
+
+class ResultCache:
+    """
+    Caches the results of each cell of a sweep on disk, so that re-running an
+    overlapping sweep only runs the new cells.
+
+    Results are keyed on the arguments and seed of the cell, and on a hash of
+    the `graph_experiments` source code, so that changes to the code are never
+    served stale results.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        if not directory.is_dir():
+            directory.mkdir(parents=True)
+        self.directory = directory
+        self.code_version = code_version()
+
+    def get(
+        self,
+        strategy_args: StrategyArgs,
+        graph_args: GraphArgs,
+        test_args: TestArgs,
+        seed: int,
+    ) -> Optional[ConnectednessResults]:
+        path = self.__path(strategy_args, graph_args, test_args, seed)
+        if not path.is_file():
+            return None
+        with open(str(path), "r") as file:
+            results = json.load(file)["results"]
+        results["num_requests_histogram"] = tuple(
+            results["num_requests_histogram"]
+        )
+        return ConnectednessResults(**results)
+
+    def put(
+        self,
+        strategy_args: StrategyArgs,
+        graph_args: GraphArgs,
+        test_args: TestArgs,
+        seed: int,
+        results: ConnectednessResults,
+    ) -> None:
+        path = self.__path(strategy_args, graph_args, test_args, seed)
+        entry = {
+            "code_version": self.code_version,
+            "strategy_args": strategy_args._asdict(),
+            "graph_args": graph_args._asdict(),
+            "test_args": test_args._asdict(),
+            "seed": seed,
+            "results": results._asdict(),
+        }
+        # Write to a temporary file first so that concurrent readers never
+        # see a partially written entry
+        file_descriptor, temp_path = tempfile.mkstemp(dir=str(self.directory))
+        with os.fdopen(file_descriptor, "w") as file:
+            json.dump(entry, file)
+        os.replace(temp_path, str(path))
+
+    def __path(
+        self,
+        strategy_args: StrategyArgs,
+        graph_args: GraphArgs,
+        test_args: TestArgs,
+        seed: int,
+    ) -> Path:
+        key = get_key(
+            [self.code_version, strategy_args, graph_args, test_args, seed]
+        )
+        return self.directory / f"{key}.json"
+
+
+class GraphSnapshots:
+    """
+    Stores the graph built for each cell of a sweep on disk, so that it can be
+    tested again with different searches without being rebuilt.
+
+    Graphs are keyed on the arguments and seed used to build them, and on a
+    hash of the `graph_experiments` source code. Snapshots are loaded
+    memory-mapped, so parallel jobs testing the same graph share its pages.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        if not directory.is_dir():
+            directory.mkdir(parents=True)
+        self.directory = directory
+        self.code_version = code_version()
+
+    def get(
+        self, strategy_args: StrategyArgs, graph_args: GraphArgs, seed: int
+    ) -> Optional[Graph]:
+        path = self.__path(strategy_args, graph_args, seed)
+        if not path.is_dir():
+            return None
+        return Graph.load(path)
+
+    def put(
+        self,
+        strategy_args: StrategyArgs,
+        graph_args: GraphArgs,
+        seed: int,
+        graph: Graph,
+    ) -> None:
+        path = self.__path(strategy_args, graph_args, seed)
+        metadata = {
+            "code_version": self.code_version,
+            "strategy_args": strategy_args._asdict(),
+            "graph_args": graph_args._asdict(),
+            "seed": seed,
+        }
+        # Save to a temporary directory first and rename it into place, so
+        # that concurrent readers never see a partially written snapshot
+        temp_path = Path(tempfile.mkdtemp(dir=str(self.directory)))
+        graph.save(temp_path, metadata)
+        try:
+            os.rename(str(temp_path), str(path))
+        except OSError:
+            # Another process saved the same snapshot first
+            shutil.rmtree(str(temp_path))
+
+    def __path(
+        self, strategy_args: StrategyArgs, graph_args: GraphArgs, seed: int
+    ) -> Path:
+        key = get_key([self.code_version, strategy_args, graph_args, seed])
+        return self.directory / key
+
+
+def get_key(values: List[Any]) -> str:
+    """
+    Gets a hash of JSON serializable values for use as a file name.
+    """
+    return hashlib.sha256(json.dumps(values).encode()).hexdigest()
+
+
+def code_version() -> str:
+    """
+    Gets a hash of the `graph_experiments` source code.
+    """
+    source_hash = hashlib.sha256()
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        source_hash.update(path.name.encode())
+        source_hash.update(path.read_bytes())
+    return source_hash.hexdigest()
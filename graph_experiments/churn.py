@@ -0,0 +1,412 @@
+"""
+Simulates churn in a network, where nodes arrive and depart over time.
+
+Nodes arrive at a fixed rate and join through a random node, and each node
+departs at a fixed rate without warning. Optionally, every node periodically
+checks its neighbours and removes those that have failed too many checks in a
+row, as the daemon's `NeighbourGc` does. Searches between the nodes that are
+alive are measured periodically.
+
+For example, to start from a network of 1000 nodes where each node stays for
+a day on average, with new nodes arriving to keep the size of the network
+steady, run:
+
+  python -m graph_experiments.churn \
+    --neighbour-strategy closest \
+    --distance wrapped \
+    --test-strategy all-knowing \
+    --num-nodes 1000 \
+    --departure-rate 0.0000116 \
+    --num-events 10000
+"""
+
+import random
+from argparse import ArgumentParser
+from typing import NamedTuple, Iterator, List
+
+import numpy as np
+
+from graph_experiments import (
+    Graph,
+    NeighbourStrategy,
+    TestStrategy,
+    Distance,
+    GraphArgs,
+    TestArgs,
+    ChurnArgs,
+)
+from graph_experiments.graph import NO_NEIGHBOUR
+from graph_experiments.test_strategy import Joining
+from graph_experiments.tester import ConnectednessResults, test_nodes
+
+GC_FREQUENCY_SEC = 1200
+"""Matches `DEFAULT_FREQUENCY_SEC` in the daemon's `NeighbourGc`."""
+
+GC_NUM_RETRIES = 3
+"""Matches `DEFAULT_NUM_RETRIES` in the daemon's `NeighbourGc`."""
+
+JOIN_BATCH_SIZE = 256
+"""
+The most arrivals that are joined concurrently. Arrivals are also joined before
+every check and measurement.
+"""
+
+
+class ChurnResults(NamedTuple):
+    time: float
+    num_alive: int
+    results: ConnectednessResults
+
+    def __str__(self) -> str:
+        return ",".join(
+            [
+                f"t={self.time:.0f}",
+                f"alive={self.num_alive}",
+                str(self.results),
+            ]
+        )
+
+
+class ChurnSimulation:
+    """
+    Runs events on a graph where nodes arrive and depart.
+
+    Departed nodes keep their index and stay in the graph, but no longer
+    respond to requests. New nodes are added to the end of the graph, which
+    grows as needed, so that indices are never reused.
+
+    Arriving nodes are alive straight away, but join in batches, with each
+    batch of searches running concurrently. This approximates joins that
+    overlap in time, and is much faster than joining nodes one at a time.
+
+    The statuses of each node's neighbours are kept in arrays sorted by a key
+    of the node and neighbour indices, so that checking every node's
+    neighbours is vectorized over the whole graph.
+    """
+
+    def __init__(
+        self,
+        graph: Graph,
+        neighbour_strategy: NeighbourStrategy,
+        args: ChurnArgs,
+    ) -> None:
+        self.graph = graph.copy()
+        self.neighbour_strategy = neighbour_strategy
+        self.args = args
+        self.time = 0.0
+        # Number of nodes added to the graph, alive or not. Rows beyond this
+        # are spare capacity for new nodes.
+        self.num_nodes = len(graph)
+        self.alive = np.ones(len(graph), dtype=bool)
+        # The first `num_alive` entries of `alive_indices` are the indices of
+        # the alive nodes, in no order
+        self.num_alive = len(graph)
+        self.alive_indices = np.arange(len(graph))
+        # Nodes that have arrived but not yet joined
+        self.arrived: List[int] = []
+        # Neighbour statuses, as in the daemon's `NeighbourStatus`
+        self.status_keys = np.empty(0, dtype=np.int64)
+        self.consecutive_failed = np.empty(0, dtype=np.int64)
+        self.retry_cooloff = np.empty(0, dtype=np.int64)
+
+    def run(self, test_args: TestArgs) -> Iterator[ChurnResults]:
+        """
+        Runs `num_events` arrivals and departures, yielding measurements of the
+        network every `measure_period` seconds, and at the end.
+        """
+        assert self.args.arrival_rate > 0 or self.args.departure_rate > 0
+        next_gc_time = self.args.gc_period
+        next_measure_time = 0.0
+        for _ in range(self.args.num_events):
+            arrival_rate = self.args.arrival_rate
+            total_rate = (
+                arrival_rate + self.args.departure_rate * self.num_alive
+            )
+            if total_rate == 0:
+                # Every node has departed and no more arrive, so nothing else
+                # can happen
+                break
+            self.time += random.expovariate(total_rate)
+
+            while (
+                next_gc_time is not None and next_gc_time <= self.time
+            ) or next_measure_time <= self.time:
+                self.__join_arrived()
+                if next_gc_time is not None and next_gc_time <= min(
+                    next_measure_time, self.time
+                ):
+                    self.__check_neighbours()
+                    next_gc_time += self.args.gc_period
+                else:
+                    yield self.__measure(next_measure_time, test_args)
+                    next_measure_time += self.args.measure_period
+
+            if random.random() * total_rate < arrival_rate:
+                self.__arrive()
+            else:
+                self.__depart()
+
+        self.__join_arrived()
+        yield self.__measure(self.time, test_args)
+
+    def __arrive(self) -> None:
+        if self.num_nodes == len(self.graph):
+            self.__grow()
+        index = self.num_nodes
+        self.num_nodes += 1
+        self.alive[index] = True
+        self.alive_indices[self.num_alive] = index
+        self.num_alive += 1
+
+        self.arrived.append(index)
+        if len(self.arrived) >= JOIN_BATCH_SIZE:
+            self.__join_arrived()
+
+    def __join_arrived(self) -> None:
+        """
+        Joins the arrived nodes that are still alive, each through a random
+        alive node that has already joined. If there are no such nodes, the
+        arrived nodes are left unconnected.
+        """
+        arrived = set(self.arrived)
+        joining = [index for index in self.arrived if self.alive[index]]
+        self.arrived = []
+        if not joining or len(joining) == self.num_alive:
+            return
+
+        connect_indices = []
+        for _ in joining:
+            connect_index = int(
+                self.alive_indices[random.randrange(self.num_alive)]
+            )
+            while connect_index in arrived:
+                connect_index = int(
+                    self.alive_indices[random.randrange(self.num_alive)]
+                )
+            connect_indices.append(connect_index)
+
+        Joining.join(
+            self.graph,
+            np.array(joining),
+            np.array(connect_indices),
+            self.neighbour_strategy,
+            self.alive,
+        )
+
+    def __depart(self) -> None:
+        position = random.randrange(self.num_alive)
+        index = self.alive_indices[position]
+        last_index = self.alive_indices[self.num_alive - 1]
+        self.alive_indices[position] = last_index
+        self.num_alive -= 1
+        self.alive[index] = False
+
+    def __grow(self) -> None:
+        """
+        Doubles the capacity of the graph. Positions of new nodes are picked
+        when the capacity is added.
+        """
+        capacity = max(len(self.graph), 1)
+        self.graph = Graph(
+            np.concatenate(
+                [
+                    self.graph.positions,
+                    self.neighbour_strategy.distance.random_positions(
+                        capacity
+                    ),
+                ]
+            ),
+            np.concatenate(
+                [
+                    self.graph.neighbours,
+                    np.full(
+                        (capacity, self.graph.max_neighbours),
+                        NO_NEIGHBOUR,
+                        dtype=self.graph.neighbours.dtype,
+                    ),
+                ]
+            ),
+        )
+        self.alive = np.concatenate([self.alive, np.zeros(capacity, bool)])
+        self.alive_indices = np.concatenate(
+            [self.alive_indices, np.zeros(capacity, dtype=np.int64)]
+        )
+
+    def __check_neighbours(self) -> None:
+        """
+        Checks every alive node's neighbours in the same way as
+        `NeighbourGc::check_all_neighbours`, removing neighbours that have
+        failed `gc_num_retries` checks in a row.
+
+        Unlike the daemon, where each node checks at random intervals, all
+        nodes check at the same time.
+        """
+        neighbours = self.graph.neighbours
+        # Alive nodes are checked in order, with each node's neighbours in
+        # order, so that the keys are already sorted
+        alive_indices = np.sort(self.alive_indices[: self.num_alive])
+        columns_by_target = np.argsort(neighbours[alive_indices], axis=1)
+        sorted_neighbours = np.take_along_axis(
+            neighbours[alive_indices], columns_by_target, axis=1
+        )
+        alive_rows, sorted_columns = np.nonzero(
+            sorted_neighbours != NO_NEIGHBOUR
+        )
+        rows = alive_indices[alive_rows]
+        columns = columns_by_target[alive_rows, sorted_columns]
+        targets = sorted_neighbours[alive_rows, sorted_columns]
+        keys = (rows.astype(np.int64) << 32) | targets.astype(np.int64)
+
+        # Look up the existing statuses, with new neighbours starting afresh
+        consecutive_failed = np.zeros(len(keys), dtype=np.int64)
+        retry_cooloff = np.zeros(len(keys), dtype=np.int64)
+        if len(self.status_keys) > 0:
+            status_indices = np.minimum(
+                np.searchsorted(self.status_keys, keys),
+                len(self.status_keys) - 1,
+            )
+            has_status = self.status_keys[status_indices] == keys
+            consecutive_failed[has_status] = self.consecutive_failed[
+                status_indices[has_status]
+            ]
+            retry_cooloff[has_status] = self.retry_cooloff[
+                status_indices[has_status]
+            ]
+
+        # Neighbours in their cooloff aren't checked, alive neighbours are
+        # reset, and dead neighbours fail with a longer cooloff
+        cooling_off = retry_cooloff > 0
+        responded = ~cooling_off & self.alive[targets]
+        failed = ~cooling_off & ~self.alive[targets]
+        retry_cooloff[cooling_off] -= 1
+        consecutive_failed[responded] = 0
+        retry_cooloff[responded] = 0
+        consecutive_failed[failed] += 1
+        retry_cooloff[failed] = consecutive_failed[failed]
+
+        removed = consecutive_failed >= self.args.gc_num_retries
+        if np.any(removed):
+            neighbours[rows[removed], columns[removed]] = NO_NEIGHBOUR
+            # Move the removed neighbours to the end of each row
+            changed_rows = np.unique(rows[removed])
+            changed = neighbours[changed_rows]
+            neighbours[changed_rows] = np.take_along_axis(
+                changed,
+                np.argsort(changed == NO_NEIGHBOUR, axis=1, kind="stable"),
+                axis=1,
+            )
+
+        # Only keep statuses of current neighbours
+        kept = ~removed
+        self.status_keys = keys[kept]
+        self.consecutive_failed = consecutive_failed[kept]
+        self.retry_cooloff = retry_cooloff[kept]
+
+    def __measure(self, time: float, test_args: TestArgs) -> ChurnResults:
+        """
+        Tests searches between alive nodes, where requests to departed nodes
+        fail.
+        """
+        graph = Graph(
+            self.graph.positions[: self.num_nodes],
+            np.where(
+                self.alive[: self.num_nodes, np.newaxis],
+                self.graph.neighbours[: self.num_nodes],
+                NO_NEIGHBOUR,
+            ),
+        )
+        return ChurnResults(
+            time,
+            self.num_alive,
+            test_nodes(
+                graph,
+                self.neighbour_strategy.distance,
+                test_args,
+                self.alive_indices[: self.num_alive],
+            ),
+        )
+
+
+def main():
+    parser = ArgumentParser("graph_experiments.churn")
+    parser.add_argument("--neighbour-strategy", type=str, required=True)
+    parser.add_argument("--distance", type=str, required=True)
+    parser.add_argument("--test-strategy", type=str, required=True)
+    parser.add_argument("--num-nodes", type=int, default=100)
+    parser.add_argument("--key-space-dimensions", type=int, default=2)
+    parser.add_argument("--max-neighbours", type=int, default=10)
+    parser.add_argument("--num-events", type=int, required=True)
+    parser.add_argument("--departure-rate", type=float, required=True)
+    # Defaults to the rate that keeps the number of nodes steady
+    parser.add_argument("--arrival-rate", type=float, default=None)
+    parser.add_argument("--gc-period", type=float, default=GC_FREQUENCY_SEC)
+    parser.add_argument("--gc-num-retries", type=int, default=GC_NUM_RETRIES)
+    parser.add_argument("--no-gc", action="store_true")
+    parser.add_argument("--measure-period", type=float, default=3600)
+    parser.add_argument("--num-search-tests", type=int, default=100)
+    parser.add_argument(
+        "--search",
+        type=str,
+        choices=["best-first", "greedy"],
+        default="best-first",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output-path", type=str, default="churn.png")
+    parser_args = parser.parse_args()
+
+    if parser_args.seed is not None:
+        random.seed(parser_args.seed)
+        np.random.seed(parser_args.seed)
+
+    graph_args = GraphArgs(
+        parser_args.num_nodes,
+        parser_args.key_space_dimensions,
+        parser_args.max_neighbours,
+    )
+    churn_args = ChurnArgs(
+        parser_args.num_events,
+        (
+            parser_args.arrival_rate
+            if parser_args.arrival_rate is not None
+            else parser_args.departure_rate * parser_args.num_nodes
+        ),
+        parser_args.departure_rate,
+        None if parser_args.no_gc else parser_args.gc_period,
+        parser_args.gc_num_retries,
+        parser_args.measure_period,
+    )
+    test_args = TestArgs(parser_args.num_search_tests, 1, parser_args.search)
+
+    distance = Distance.get(parser_args.distance, graph_args)
+    neighbour_strategy = NeighbourStrategy.get(
+        parser_args.neighbour_strategy, distance, graph_args
+    )
+    test_strategy = TestStrategy.get(parser_args.test_strategy)
+    graph = Graph.random(graph_args, distance)
+    graph = test_strategy.apply(graph, neighbour_strategy)
+
+    all_churn_results = []
+    for churn_results in ChurnSimulation(
+        graph, neighbour_strategy, churn_args
+    ).run(test_args):
+        print(churn_results, flush=True)
+        all_churn_results.append(churn_results)
+
+    __plot(all_churn_results, parser_args.output_path)
+
+
+def __plot(all_churn_results: List[ChurnResults], output_path: str) -> None:
+    # Imported here as importing `matplotlib` is slow, and isn't needed to run
+    # the simulation
+    import matplotlib.pyplot as plt
+
+    times = [r.time for r in all_churn_results]
+    plt.plot(times, [r.results.successful_percent for r in all_churn_results])
+    plt.xlabel("Time (s)")
+    plt.ylabel("Successful searches")
+    plt.savefig(output_path)
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,10 @@
 KEY_SPACE_LOWER = -1
 KEY_SPACE_UPPER = 1
 KEY_SPACE_WIDTH = KEY_SPACE_UPPER - KEY_SPACE_LOWER
+
+# Bounds of the `i32` coordinates used by the daemon's `KeySpaceManager`. As in
+# the daemon, the width is one less than the number of coordinates, so that the
+# lowest and highest coordinates are in the same place.
+KIPA_KEY_SPACE_LOWER = -(2**31)
+KIPA_KEY_SPACE_UPPER = 2**31 - 1
+KIPA_KEY_SPACE_WIDTH = KIPA_KEY_SPACE_UPPER - KIPA_KEY_SPACE_LOWER
@@ -1,7 +1,17 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Optional
 
-from graph_experiments import KeySpace, GraphArgs, constants
+import numpy as np
+
+from graph_experiments import (
+    KeySpace,
+    GraphArgs,
+    SpatialIndex,
+    constants,
+    create_from_keys,
+    random_key_data,
+    KeySpaceGenerator,
+)
 
 
 class Distance(ABC):
@@ -20,16 +30,42 @@ class Distance(ABC):
             return Ring(args)
         elif name == "lattice":
             return Lattice(10, args)
+        elif name == "kipa":
+            return Kipa(args)
         else:
             raise AssertionError(f"Unknown distance: {name}")
 
-    @abstractmethod
     def distance(self, a: KeySpace, b: KeySpace) -> float:
         """
         Calculates the distance between two points in key space.
         """
+        assert len(a.position) == len(b.position)
+        return float(
+            self.distances(
+                np.asarray(a.position, dtype=float),
+                np.asarray(b.position, dtype=float),
+            )
+        )
+
+    @abstractmethod
+    def distances(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """
+        Calculates the distances between arrays of points in key space.
+
+        The last axis of `a` and `b` holds the position in each dimension, and
+        all other axes are broadcast against each other. For example, a `(D,)`
+        point against an `(N, D)` array gives the `(N,)` distances from the
+        point to every row.
+        """
         raise NotImplementedError()
 
+    def pairwise_distances(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """
+        Calculates the `(M, N)` distances between every row of an `(M, D)`
+        array and every row of an `(N, D)` array.
+        """
+        return self.distances(a[:, np.newaxis, :], b[np.newaxis, :, :])
+
     @abstractmethod
     def max_distance(self) -> float:
         """
@@ -37,19 +73,57 @@ class Distance(ABC):
         """
         raise NotImplementedError()
 
+    def spatial_index(self, positions: np.ndarray) -> Optional[SpatialIndex]:
+        """
+        Creates an index for finding the nearest points to each other under
+        this distance, or `None` if the distance can't be indexed.
+        """
+        return None
+
+    def random_positions(self, num_nodes: int) -> np.ndarray:
+        """
+        Picks `num_nodes` positions uniformly distributed in the key space that
+        this distance is over, as an `(N, D)` array.
+        """
+        return np.random.uniform(
+            constants.KEY_SPACE_LOWER,
+            constants.KEY_SPACE_UPPER,
+            size=(num_nodes, self.args.key_space_dimensions),
+        )
+
+    def generate_positions(
+        self, generator: KeySpaceGenerator, start: int, stop: int
+    ) -> np.ndarray:
+        """
+        Gets the positions of nodes `start` to `stop` from `generator`, with
+        the same distribution as `random_positions`.
+        """
+        return generator.uniform(
+            start, stop, constants.KEY_SPACE_LOWER, constants.KEY_SPACE_UPPER
+        )
+
+
+def _wrapped_differences(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    The absolute difference between each dimension of `a` and `b`, taking the
+    shortest route around the wrapped key space.
+    """
+    difference = a - b
+    return np.minimum(
+        np.abs(difference),
+        np.minimum(
+            np.abs(difference + constants.KEY_SPACE_WIDTH),
+            np.abs(difference - constants.KEY_SPACE_WIDTH),
+        ),
+    )
+
 
 class Wrapped(Distance):
-    def distance(self, a: KeySpace, b: KeySpace) -> float:
-        assert len(a.position) == len(b.position)
-        total = float(0)
-        for a, b in zip(a.position, b.position):
-            distance = min(
-                abs(a - b),
-                abs((a + constants.KEY_SPACE_WIDTH) - b),
-                abs((a - constants.KEY_SPACE_WIDTH) - b),
-            )
-            total += distance ** 2
-        return total ** 0.5
+    def distances(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return np.sqrt(np.sum(_wrapped_differences(a, b) ** 2, axis=-1))
+
+    def spatial_index(self, positions: np.ndarray) -> Optional[SpatialIndex]:
+        return SpatialIndex(positions, p=2, wrapped=True)
 
     def max_distance(self) -> float:
         return (
@@ -59,17 +133,11 @@ class Wrapped(Distance):
 
 
 class ManhattanWrapped(Distance):
-    def distance(self, a: KeySpace, b: KeySpace) -> float:
-        assert len(a.position) == len(b.position)
-        total = float(0)
-        for a, b in zip(a.position, b.position):
-            distance = min(
-                abs(a - b),
-                abs((a + constants.KEY_SPACE_WIDTH) - b),
-                abs((a - constants.KEY_SPACE_WIDTH) - b),
-            )
-            total += distance
-        return total
+    def distances(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return np.sum(_wrapped_differences(a, b), axis=-1)
+
+    def spatial_index(self, positions: np.ndarray) -> Optional[SpatialIndex]:
+        return SpatialIndex(positions, p=1, wrapped=True)
 
     def max_distance(self) -> float:
         return (
@@ -78,10 +146,11 @@ class ManhattanWrapped(Distance):
 
 
 class Unwrapped(Distance):
-    def distance(self, a: KeySpace, b: KeySpace) -> float:
-        assert len(a.position) == len(b.position)
-        total = sum((a - b) ** 2 for a, b in zip(a.position, b.position))
-        return total ** 0.5
+    def distances(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return np.sqrt(np.sum((a - b) ** 2, axis=-1))
+
+    def spatial_index(self, positions: np.ndarray) -> Optional[SpatialIndex]:
+        return SpatialIndex(positions, p=2, wrapped=False)
 
     def max_distance(self) -> float:
         return (
@@ -95,16 +164,11 @@ class Ring(Distance):
         super().__init__(args)
         self.underlying = Wrapped(args)
 
-    def distance(self, a: KeySpace, b: KeySpace) -> float:
+    def distances(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
         assert self.args.key_space_dimensions > 1
-        radius, *a_position = a.position
-        _, *b_position = b.position
-        radius = abs(radius)
-        return abs(
-            radius
-            - self.underlying.distance(
-                KeySpace(a_position), KeySpace(b_position)
-            )
+        radius = np.abs(a[..., 0])
+        return np.abs(
+            radius - self.underlying.distances(a[..., 1:], b[..., 1:])
         )
 
     def max_distance(self) -> float:
@@ -116,23 +180,72 @@ class Lattice(Distance):
         super().__init__(args)
         self.num_symbols = num_symbols
 
-    def distance(self, a: KeySpace, b: KeySpace) -> float:
-        return float(
-            sum(
-                a != b
-                for a, b in zip(self.__to_symbols(a), self.__to_symbols(b))
-            )
-        )
+    def distances(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return np.sum(
+            self.__to_symbols(a) != self.__to_symbols(b), axis=-1
+        ).astype(float)
 
     def max_distance(self) -> float:
         return self.args.key_space_dimensions
 
-    def __to_symbols(self, key_space: KeySpace) -> List[int]:
-        return [
-            int(
-                self.num_symbols
-                * (p - constants.KEY_SPACE_LOWER)
-                / (constants.KEY_SPACE_UPPER - constants.KEY_SPACE_LOWER)
+    def __to_symbols(self, positions: np.ndarray) -> np.ndarray:
+        return (
+            self.num_symbols
+            * (positions - constants.KEY_SPACE_LOWER)
+            / (constants.KEY_SPACE_UPPER - constants.KEY_SPACE_LOWER)
+        ).astype(int)
+
+
+class Kipa(Distance):
+    """
+    The distance used by the daemon's `KeySpaceManager`, over the same `i32`
+    key space. Positions are `int32` arrays created from key data in the same
+    way as the daemon.
+    """
+
+    def distances(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        # Differences between `i32`s need 64 bits, as in the daemon
+        difference = np.abs(a.astype(np.int64) - b.astype(np.int64))
+        total = np.sum(
+            np.minimum(
+                difference, constants.KIPA_KEY_SPACE_WIDTH - difference
+            ),
+            axis=-1,
+        )
+        # The daemon calculates the root in single precision, so we do the
+        # same to get the same ordering of distances that are nearly equal
+        root = np.float32(1 / self.args.key_space_dimensions)
+        return (total.astype(np.float32) ** root).astype(float)
+
+    def spatial_index(self, positions: np.ndarray) -> Optional[SpatialIndex]:
+        # Taking the root doesn't change the order of distances, so the nearest
+        # points are the nearest in wrapped Manhattan distance
+        return SpatialIndex(
+            positions,
+            p=1,
+            wrapped=True,
+            lower=constants.KIPA_KEY_SPACE_LOWER,
+            width=constants.KIPA_KEY_SPACE_WIDTH,
+        )
+
+    def max_distance(self) -> float:
+        return float(
+            (
+                (constants.KIPA_KEY_SPACE_WIDTH // 2)
+                * self.args.key_space_dimensions
             )
-            for p in key_space.position
-        ]
+            ** (1 / self.args.key_space_dimensions)
+        )
+
+    def random_positions(self, num_nodes: int) -> np.ndarray:
+        return create_from_keys(
+            random_key_data(num_nodes, self.args.key_space_dimensions),
+            self.args.key_space_dimensions,
+        )
+
+    def generate_positions(
+        self, generator: KeySpaceGenerator, start: int, stop: int
+    ) -> np.ndarray:
+        return create_from_keys(
+            generator.key_data(start, stop), self.args.key_space_dimensions
+        )
@@ -0,0 +1,154 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from graph_experiments import (
+    Node,
+    KeySpace,
+    GraphArgs,
+    Distance,
+    KeySpaceGenerator,
+)
+
+NO_NEIGHBOUR = -1
+"""Padding value for unused slots in `Graph.neighbours`."""
+
+POSITIONS_FILE_NAME = "positions.npy"
+NEIGHBOURS_FILE_NAME = "neighbours.npy"
+METADATA_FILE_NAME = "metadata.json"
+
+GENERATE_CHUNK_SIZE = 65536
+"""The number of positions to generate at once in `Graph.random`."""
+
+
+class Graph:
+    """
+    A graph of nodes stored in contiguous arrays, where nodes are referred to
+    by their index.
+
+    `positions` is an `(N, D)` array of each node's position in key space.
+    `neighbours` is an `(N, max_neighbours)` array of each node's neighbour
+    indices, where each row is padded at the end with `NO_NEIGHBOUR`.
+    """
+
+    def __init__(self, positions: np.ndarray, neighbours: np.ndarray) -> None:
+        assert positions.ndim == 2 and neighbours.ndim == 2
+        assert len(positions) == len(neighbours)
+        self.positions = positions
+        self.neighbours = neighbours
+
+    @classmethod
+    def empty(cls, positions: np.ndarray, max_neighbours: int) -> "Graph":
+        """
+        Creates a graph where no node has any neighbours.
+        """
+        return Graph(
+            positions,
+            np.full(
+                (len(positions), max_neighbours), NO_NEIGHBOUR, dtype=np.int32
+            ),
+        )
+
+    @classmethod
+    def random(
+        cls,
+        args: GraphArgs,
+        distance: Distance,
+        generator: Optional[KeySpaceGenerator] = None,
+    ) -> "Graph":
+        """
+        Creates a graph of unconnected nodes uniformly distributed in the key
+        space that `distance` is over.
+
+        If `generator` is given, positions are generated from it in chunks, so
+        that the same seed always gives the same graph without using the
+        global random state.
+        """
+        if generator is None:
+            return cls.empty(
+                distance.random_positions(args.num_nodes), args.max_neighbours
+            )
+
+        positions = np.empty(
+            (args.num_nodes, args.key_space_dimensions),
+            dtype=distance.generate_positions(generator, 0, 0).dtype,
+        )
+        for start in range(0, args.num_nodes, GENERATE_CHUNK_SIZE):
+            stop = min(start + GENERATE_CHUNK_SIZE, args.num_nodes)
+            positions[start:stop] = distance.generate_positions(
+                generator, start, stop
+            )
+        return cls.empty(positions, args.max_neighbours)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @property
+    def max_neighbours(self) -> int:
+        return self.neighbours.shape[1]
+
+    def neighbours_of(self, index: int) -> np.ndarray:
+        row = self.neighbours[index]
+        return row[row != NO_NEIGHBOUR]
+
+    def set_neighbours(self, index: int, neighbours: np.ndarray) -> None:
+        assert len(neighbours) <= self.max_neighbours
+        self.neighbours[index, : len(neighbours)] = neighbours
+        self.neighbours[index, len(neighbours) :] = NO_NEIGHBOUR
+
+    def copy(self) -> "Graph":
+        """
+        Copies the graph's neighbours. Positions are never modified, so they
+        are shared with the copy.
+        """
+        return Graph(self.positions, self.neighbours.copy())
+
+    def save(
+        self, directory: Path, metadata: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Saves the graph to a snapshot directory, with each array in its own
+        `.npy` file so that it can be memory-mapped by `load`.
+
+        `metadata` is any extra JSON describing how the graph was built, and is
+        saved alongside the arrays for reference.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(str(directory / POSITIONS_FILE_NAME), self.positions)
+        np.save(str(directory / NEIGHBOURS_FILE_NAME), self.neighbours)
+        with open(str(directory / METADATA_FILE_NAME), "w") as file:
+            json.dump(
+                {
+                    "num_nodes": len(self),
+                    "key_space_dimensions": self.positions.shape[1],
+                    "max_neighbours": self.max_neighbours,
+                    **(metadata or {}),
+                },
+                file,
+            )
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> "Graph":
+        """
+        Loads a graph saved by `save`.
+
+        If `mmap` is true, the arrays are memory-mapped read-only rather than
+        read into memory, so processes loading the same snapshot share the
+        same pages. `copy` gives a graph whose neighbours can be modified.
+        """
+        mmap_mode = "r" if mmap else None
+        return Graph(
+            np.load(str(directory / POSITIONS_FILE_NAME), mmap_mode=mmap_mode),
+            np.load(
+                str(directory / NEIGHBOURS_FILE_NAME), mmap_mode=mmap_mode
+            ),
+        )
+
+    def node(self, index: int) -> Node:
+        return Node(
+            index,
+            KeySpace(tuple(self.positions[index].tolist())),
+            frozenset(self.neighbours_of(index).tolist()),
+        )
@@ -0,0 +1,182 @@
+import bisect
+import heapq
+from typing import NamedTuple, Optional, Set, List, Tuple
+
+import numpy as np
+
+from graph_experiments import Graph, Distance, Adversary, Latency
+from graph_experiments.graph import NO_NEIGHBOUR
+from graph_experiments.profiling import count
+
+SEARCH_BREADTH = 3
+"""Matches `DEFAULT_SEARCH_BREADTH` in the daemon."""
+
+MAX_NUM_SEARCH_THREADS = 3
+"""Matches `DEFAULT_MAX_NUM_SEARCH_THREADS` in the daemon."""
+
+SEARCH_TIMEOUT_SEC = 5
+"""Matches `DEFAULT_SEARCH_TIMEOUT_SEC` in the daemon."""
+
+QUERY_RESPONSE_SIZE = 5
+"""Matches the number of nodes returned for a `QueryRequest` in the daemon."""
+
+
+class SearchResult(NamedTuple):
+    num_requests: int
+    # Simulated time from starting the search to finding the node
+    time_sec: float
+
+
+class GraphSearch:
+    """
+    A discrete-event model of the daemon's `GraphSearch`.
+
+    The search starts from the searching node's own neighbours, and each
+    queried node returns its `QUERY_RESPONSE_SIZE` neighbours closest to the
+    key. Up to `max_num_search_threads` queries run at once, each taking a
+    time picked from `latency`, and responses are handled in the order they
+    arrive. Queries that take longer than `timeout_sec` fail. The search
+    succeeds as soon as the key's node is found, and fails once the `breadth`
+    closest found nodes have all been explored.
+
+    If `latency` isn't given, queries respond immediately, so apart from
+    queries to fake nodes, which time out, each query finishes before the next
+    one starts.
+
+    If `malicious` is given, it is a boolean mask of the nodes that respond to
+    queries using `adversary` rather than honestly.
+    """
+
+    def __init__(
+        self,
+        graph: Graph,
+        distance: Distance,
+        breadth: int = SEARCH_BREADTH,
+        adversary: Optional[Adversary] = None,
+        malicious: Optional[np.ndarray] = None,
+        max_num_search_threads: int = MAX_NUM_SEARCH_THREADS,
+        latency: Optional[Latency] = None,
+        timeout_sec: float = SEARCH_TIMEOUT_SEC,
+    ) -> None:
+        assert (adversary is None) == (malicious is None)
+        assert max_num_search_threads > 0
+        self.graph = graph
+        self.distance = distance
+        self.breadth = breadth
+        self.adversary = adversary
+        self.malicious = malicious
+        self.max_num_search_threads = max_num_search_threads
+        self.latency = latency
+        self.timeout_sec = timeout_sec
+
+    def search(self, from_index: int, to_index: int) -> Optional[SearchResult]:
+        """
+        Searches from `from_index` for `to_index`, returning the number of
+        requests made and the time taken, or `None` if the search failed.
+        """
+        to_position = self.graph.positions[to_index]
+        from_distance = float(
+            self.distance.distances(
+                to_position, self.graph.positions[from_index]
+            )
+        )
+        found: Set[int] = {from_index}
+        explored: Set[int] = set()
+        to_explore: List[Tuple[float, int]] = [(from_distance, from_index)]
+        closest_found: List[Tuple[float, int]] = [(from_distance, from_index)]
+        # Queries that have been sent, as `(finish_time, request_number, node,
+        # responded)`, ordered by when they finish
+        active: List[Tuple[float, int, int, bool]] = []
+        # Fake nodes are given unique negative indices, so that they can be
+        # told apart from each other and from real nodes
+        next_fake_index = NO_NEIGHBOUR - 1
+        num_requests = 0
+        time = 0.0
+        while True:
+            # Handle every query that has finished by now
+            while active and active[0][0] <= time:
+                _, _, exploring, responded = heapq.heappop(active)
+                explored.add(exploring)
+                indices, distances = (
+                    self.__query(exploring, from_index, to_position)
+                    if responded
+                    else (np.empty(0, dtype=np.int32), np.empty(0))
+                )
+                num_to_explore = len(to_explore)
+                for index, distance in zip(
+                    indices.tolist(), distances.tolist()
+                ):
+                    if index == NO_NEIGHBOUR:
+                        index = next_fake_index
+                        next_fake_index -= 1
+                    elif index in found:
+                        continue
+                    if index == to_index:
+                        return SearchResult(num_requests, time)
+                    found.add(index)
+                    heapq.heappush(to_explore, (distance, index))
+                    bisect.insort(closest_found, (distance, index))
+                del closest_found[self.breadth :]
+                count("heap_operations", 1 + len(to_explore) - num_to_explore)
+
+                if len(closest_found) == self.breadth and all(
+                    n in explored for _, n in closest_found
+                ):
+                    return None
+
+            if not to_explore and not active:
+                return None
+            if not to_explore or len(active) >= self.max_num_search_threads:
+                # Wait for the next query to finish
+                time = active[0][0]
+                continue
+
+            _, exploring = heapq.heappop(to_explore)
+            num_requests += 1
+            count("nodes_visited")
+            count("heap_operations", 2)
+            query_time, responded = self.__query_time(exploring, from_index)
+            heapq.heappush(
+                active, (time + query_time, num_requests, exploring, responded)
+            )
+
+    def __query_time(self, index: int, from_index: int) -> Tuple[float, bool]:
+        """
+        Picks how long a query to `index` takes, and whether it gets a response
+        before timing out.
+        """
+        if index == from_index:
+            # The searching node's neighbours are read locally
+            return 0.0, True
+        if index < NO_NEIGHBOUR:
+            # Fake nodes don't exist, so querying them always times out
+            return self.timeout_sec, False
+        latency_sec = self.latency.sample() if self.latency is not None else 0
+        if latency_sec > self.timeout_sec:
+            return self.timeout_sec, False
+        return latency_sec, True
+
+    def __query(
+        self, index: int, from_index: int, to_position: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Queries `index` for the nodes closest to `to_position`, returning the
+        indices of the returned nodes and their distances to `to_position`.
+        """
+        if self.malicious is not None and self.malicious[index]:
+            indices, positions = self.adversary.respond(
+                self.graph, index, to_position, QUERY_RESPONSE_SIZE
+            )
+            count("distance_evaluations", len(positions))
+            return indices, self.distance.distances(to_position, positions)
+
+        neighbours = self.graph.neighbours_of(index)
+        distances = self.distance.distances(
+            to_position, self.graph.positions[neighbours]
+        )
+        count("distance_evaluations", len(neighbours))
+        # As in the daemon, the searching node uses all of its own neighbours
+        if index == from_index:
+            return neighbours, distances
+        closest = np.argsort(distances, kind="stable")[:QUERY_RESPONSE_SIZE]
+        return neighbours[closest], distances[closest]
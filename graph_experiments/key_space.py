@@ -0,0 +1,117 @@
+import numpy as np
+
+COORDINATE_SIZE = 4
+"""The number of bytes in each `i32` coordinate used by the daemon."""
+
+RANDOM_KEY_DATA_CHUNKS = 2
+"""
+The number of chunks of key data in the keys made by `random_key_data`.
+Uniformly random bytes fold to uniformly random coordinates regardless of the
+number of chunks, so this only needs to be enough to exercise the folding.
+"""
+
+
+def create_from_keys(
+    key_data: np.ndarray, key_space_dimensions: int
+) -> np.ndarray:
+    """
+    Creates the key space position of each key in the same way as the daemon's
+    `KeySpaceManager::create_from_key`.
+
+    `key_data` is an `(N, L)` array of each key's serialized bytes. The bytes
+    are split into chunks of one `i32` per dimension, the chunks are XOR-ed
+    together, and each dimension is read as a big endian `i32`, giving an
+    `(N, key_space_dimensions)` `int32` array.
+    """
+    assert key_data.ndim == 2 and key_data.dtype == np.uint8
+    num_keys, key_length = key_data.shape
+    chunk_size = COORDINATE_SIZE * key_space_dimensions
+
+    # Pad the last chunk with zeros, which leave the XOR unchanged. This also
+    # matches the daemon for keys shorter than one chunk, where the missing
+    # bytes fold to zero.
+    num_chunks = max(-(-key_length // chunk_size), 1)
+    padded = np.zeros((num_keys, num_chunks * chunk_size), dtype=np.uint8)
+    padded[:, :key_length] = key_data
+    folded = np.bitwise_xor.reduce(
+        padded.reshape(num_keys, num_chunks, chunk_size), axis=1
+    )
+    return np.ascontiguousarray(folded).view(">i4").astype(np.int32)
+
+
+def random_key_data(num_keys: int, key_space_dimensions: int) -> np.ndarray:
+    """
+    Creates uniformly random key data for `num_keys` keys, as an `(N, L)`
+    array of bytes.
+    """
+    return np.random.randint(
+        0,
+        256,
+        size=(
+            num_keys,
+            RANDOM_KEY_DATA_CHUNKS * COORDINATE_SIZE * key_space_dimensions,
+        ),
+        dtype=np.uint8,
+    )
+
+
+PHILOX_BLOCK_SIZE = 4
+"""The number of 64-bit values that Philox generates for each counter."""
+
+
+class KeySpaceGenerator:
+    """
+    Generates random values for any range of nodes on demand from a seed, so
+    that the same nodes can be generated in any order, in chunks or in
+    separate processes.
+
+    Uses numpy's counter-based Philox generator keyed by the seed. Each node
+    has its own range of counters, which are skipped to directly rather than
+    by generating the values of the nodes before it. Each node gets
+    `key_space_dimensions` 64-bit values.
+    """
+
+    def __init__(self, seed: int, key_space_dimensions: int):
+        self.seed = seed
+        self.key_space_dimensions = key_space_dimensions
+        self.__blocks_per_node = -(-key_space_dimensions // PHILOX_BLOCK_SIZE)
+
+    def values(self, start: int, stop: int) -> np.ndarray:
+        """
+        Gets the values of nodes `start` to `stop` as an `(N, D)` `uint64`
+        array.
+        """
+        bit_generator = np.random.Philox(key=self.seed)
+        bit_generator.advance(start * self.__blocks_per_node)
+        values_per_node = self.__blocks_per_node * PHILOX_BLOCK_SIZE
+        values = bit_generator.random_raw((stop - start) * values_per_node)
+        return values.reshape(stop - start, values_per_node)[
+            :, : self.key_space_dimensions
+        ]
+
+    def uniform(
+        self, start: int, stop: int, lower: float, upper: float
+    ) -> np.ndarray:
+        """
+        Gets uniformly random floats in `[lower, upper)` for nodes `start` to
+        `stop`, as an `(N, D)` array.
+        """
+        # The top 53 bits of each value give a uniform double in `[0, 1)`
+        unit = (self.values(start, stop) >> np.uint64(11)) * 2.0**-53
+        return lower + unit * (upper - lower)
+
+    def key_data(self, start: int, stop: int) -> np.ndarray:
+        """
+        Gets uniformly random key data for nodes `start` to `stop`, as an
+        `(N, L)` array of bytes like `random_key_data`.
+        """
+        key_length = (
+            RANDOM_KEY_DATA_CHUNKS
+            * COORDINATE_SIZE
+            * self.key_space_dimensions
+        )
+        key_data = np.ascontiguousarray(self.values(start, stop)).view(
+            np.uint8
+        )
+        assert key_data.shape[1] >= key_length
+        return key_data[:, :key_length]
@@ -0,0 +1,69 @@
+import math
+import random
+from abc import ABC, abstractmethod
+
+
+class Latency(ABC):
+    """
+    A distribution of the time taken for a node to respond to a query.
+    """
+
+    @classmethod
+    def get(cls, name: str) -> "Latency":
+        """
+        Gets a distribution from its name and parameters in seconds, e.g.
+        "constant:0.05", "exponential:0.05" or "lognormal:0.05,0.5".
+        """
+        name, _, parameters = name.partition(":")
+        values = (
+            [float(v) for v in parameters.split(",")] if parameters else []
+        )
+        if name == "constant" and len(values) == 1:
+            return Constant(*values)
+        elif name == "exponential" and len(values) == 1:
+            return Exponential(*values)
+        elif name == "lognormal" and len(values) == 2:
+            return LogNormal(*values)
+        else:
+            raise AssertionError(f"Unknown latency: {name}:{parameters}")
+
+    @abstractmethod
+    def sample(self) -> float:
+        """
+        Picks the time in seconds taken for a single query.
+        """
+        raise NotImplementedError()
+
+
+class Constant(Latency):
+    """Every query takes the same time, as on a uniform network."""
+
+    def __init__(self, latency_sec: float):
+        self.latency_sec = latency_sec
+
+    def sample(self) -> float:
+        return self.latency_sec
+
+
+class Exponential(Latency):
+    """Exponentially distributed latencies, with a few much slower queries."""
+
+    def __init__(self, mean_sec: float):
+        self.mean_sec = mean_sec
+
+    def sample(self) -> float:
+        return random.expovariate(1 / self.mean_sec)
+
+
+class LogNormal(Latency):
+    """
+    Log-normally distributed latencies, which have the long tail seen in real
+    networks. `sigma` is the standard deviation of the log of the latency.
+    """
+
+    def __init__(self, median_sec: float, sigma: float):
+        self.median_sec = median_sec
+        self.sigma = sigma
+
+    def sample(self) -> float:
+        return random.lognormvariate(math.log(self.median_sec), self.sigma)
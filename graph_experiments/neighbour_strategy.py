@@ -1,9 +1,29 @@
-import random
 from abc import ABC, abstractmethod
-from itertools import islice
-from typing import FrozenSet
+from typing import Tuple
 
-from graph_experiments import Node, GraphArgs, KeySpace, Distance
+import numpy as np
+
+from graph_experiments import GraphArgs, Distance, Graph, SpatialIndex
+from graph_experiments.graph import NO_NEIGHBOUR
+from graph_experiments.profiling import count
+
+APPLY_ALL_CHUNK_SIZE = 256
+"""
+The number of nodes to select neighbours for at once when using a
+`SpatialIndex`, bounding the memory used for large pools of candidates.
+"""
+
+ANGLE_CHUNK_SIZE = 256
+"""
+The number of candidates to find the minimum angle for at once in
+`AngleWeighted`, bounding the memory used for large numbers of candidates.
+"""
+
+ANGLE_POOL_SIZE_FACTOR = 4
+"""
+The number of nearest nodes per neighbour that `AngleWeighted.apply_all`
+chooses each node's neighbours from when using a `SpatialIndex`.
+"""
 
 
 class NeighbourStrategy(ABC):
@@ -23,46 +43,83 @@ class NeighbourStrategy(ABC):
             return ClosestRandom(distance, args)
         elif name == "closest-gaussian":
             return ClosestGaussian(distance, args)
+        elif name == "angle":
+            return AngleWeighted(distance, args)
+        elif name.startswith("angle:"):
+            # Weightings are given as "angle:<distance>,<angle>"
+            distance_weighting, angle_weighting = (
+                AngleWeighted.parse_weightings(name[len("angle:") :])
+            )
+            return AngleWeighted(
+                distance, args, distance_weighting, angle_weighting
+            )
         else:
             raise AssertionError(f"Unknown neighbour strategy: {name}")
 
     def apply(
-        self,
-        node: Node,
-        new_neighbours: FrozenSet[Node],
-        all_nodes: FrozenSet[Node],
-    ) -> Node:
+        self, graph: Graph, index: int, new_neighbours: np.ndarray
+    ) -> np.ndarray:
         """
-        Applies the neighbour selection strategy to `node` with a
-        potential `new_neighbour`.
+        Applies the neighbour selection strategy to the node at `index` with
+        potential `new_neighbours`, returning the indices of the selected
+        neighbours.
         """
-        assert len(node.neighbours) <= self.args.max_neighbours
-        current_neighbours = frozenset(
-            n for n in all_nodes if n.index in node.neighbours
-        )
+        current_neighbours = graph.neighbours_of(index)
+        assert len(current_neighbours) <= self.args.max_neighbours
+        candidates = np.union1d(current_neighbours, new_neighbours)
+        candidates = candidates[candidates != index]
         selected_neighbours = self.select_neighbours(
-            node.key_space, current_neighbours, new_neighbours
+            graph.positions[index], candidates, graph
         )
         assert len(selected_neighbours) <= self.args.max_neighbours
-        return node.with_neighbours(
-            frozenset(n.index for n in selected_neighbours)
+        return selected_neighbours
+
+    def apply_candidates(
+        self, graph: Graph, indices: np.ndarray, candidates: np.ndarray
+    ) -> np.ndarray:
+        """
+        Applies the neighbour selection strategy to each node in `indices` with
+        the potential new neighbours in the same row of `candidates`, which is
+        padded with `NO_NEIGHBOUR`. Returns the selected neighbours as a
+        `(len(indices), max_neighbours)` array padded with `NO_NEIGHBOUR`.
+        """
+        selected = np.full(
+            (len(indices), graph.max_neighbours), NO_NEIGHBOUR, dtype=np.int32
         )
+        for row, (index, new_neighbours) in enumerate(
+            zip(indices.tolist(), candidates)
+        ):
+            selected_neighbours = self.apply(
+                graph, index, new_neighbours[new_neighbours != NO_NEIGHBOUR]
+            )
+            selected[row, : len(selected_neighbours)] = selected_neighbours
+        return selected
+
+    def apply_all(self, graph: Graph) -> Graph:
+        """
+        Applies the neighbour selection strategy to every node in `graph`,
+        giving every node the choice of every other node.
+        """
+        connected_graph = graph.copy()
+        all_indices = np.arange(len(graph))
+        for index in range(len(graph)):
+            connected_graph.set_neighbours(
+                index, self.apply(graph, index, all_indices)
+            )
+        return connected_graph
 
     @abstractmethod
     def select_neighbours(
-        self,
-        local: KeySpace,
-        current_neighbours: FrozenSet[Node],
-        new_neighbours: FrozenSet[Node],
-    ) -> FrozenSet[Node]:
+        self, local: np.ndarray, candidates: np.ndarray, graph: Graph
+    ) -> np.ndarray:
         """
-        Selects which neighbours to keep out of the current and a new one.
+        Selects which neighbours to keep out of the `candidates`, which holds
+        both the current and the new neighbours.
 
-        `local` is the key space of the node that is selecting the neighbours.
+        `local` is the key space position of the node that is selecting the
+        neighbours, and `candidates` are indices into `graph`.
 
-        The number of returned neighbours must always be equal to the number of
-        `node.neighbours`. If we have less neighbours than the max, this
-        function isn't called and any new neighbours are automatically added.
+        At most `max_neighbours` candidates are returned.
         """
         raise NotImplementedError()
 
@@ -73,20 +130,51 @@ class MetricNeighbourStrategy(NeighbourStrategy, ABC):
     """
 
     def select_neighbours(
-        self,
-        local: KeySpace,
-        current_neighbours: FrozenSet[Node],
-        new_neighbours: FrozenSet[Node],
-    ) -> FrozenSet[Node]:
-        sorted_by_metric = sorted(
-            [*current_neighbours, *new_neighbours],
-            key=lambda n: self.metric(local, n),
+        self, local: np.ndarray, candidates: np.ndarray, graph: Graph
+    ) -> np.ndarray:
+        metrics = self.metric(local, graph.positions[candidates])
+        count("metric_evaluations", len(metrics))
+        sorted_by_metric = np.argsort(metrics, kind="stable")
+        return candidates[sorted_by_metric[: self.args.max_neighbours]]
+
+    def apply_candidates(
+        self, graph: Graph, indices: np.ndarray, candidates: np.ndarray
+    ) -> np.ndarray:
+        # Each node's candidates are its current neighbours and its new
+        # candidates, sorted so that ties in the metric are broken in the same
+        # order as `apply`. Invalid and repeated candidates are never selected.
+        candidates = np.hstack(
+            [graph.neighbours[indices], candidates.astype(np.int32)]
         )
-        sorted_by_metric = islice(sorted_by_metric, self.args.max_neighbours)
-        return frozenset(sorted_by_metric)
+        invalid = (candidates == NO_NEIGHBOUR) | (
+            candidates == indices[:, np.newaxis]
+        )
+        candidates[invalid] = np.iinfo(np.int32).max
+        candidates = np.sort(candidates, axis=1)
+        invalid = candidates == np.iinfo(np.int32).max
+        invalid[:, 1:] |= candidates[:, 1:] == candidates[:, :-1]
+        candidates[invalid] = NO_NEIGHBOUR
+
+        metrics = self.metric(
+            graph.positions[indices][:, np.newaxis, :],
+            graph.positions[candidates],
+        )
+        count("metric_evaluations", metrics.size)
+        metrics[invalid] = np.inf
+        sorted_by_metric = np.argsort(metrics, axis=1, kind="stable")[
+            :, : graph.max_neighbours
+        ]
+        # Invalid candidates sort last, so they only fill the padding
+        return np.take_along_axis(candidates, sorted_by_metric, axis=1)
 
     @abstractmethod
-    def metric(self, local: KeySpace, node: Node) -> float:
+    def metric(self, local: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        """
+        Calculates the metric for each row of the `(N, D)` array `positions`.
+
+        `positions` may have more leading axes, which `local` is broadcast
+        against, in which case the metric is calculated for each position.
+        """
         raise NotImplementedError()
 
 
@@ -97,23 +185,23 @@ class ContextMetricNeighbourStrategy(NeighbourStrategy, ABC):
     """
 
     def select_neighbours(
-        self,
-        local: KeySpace,
-        current_neighbours: FrozenSet[Node],
-        new_neighbours: FrozenSet[Node],
-    ) -> FrozenSet[Node]:
-        all_nodes = current_neighbours.union(new_neighbours)
-        sorted_by_metric = sorted(
-            [*current_neighbours, *new_neighbours],
-            key=lambda n: self.metric(local, n, all_nodes.difference([n])),
-        )
-        sorted_by_metric = islice(sorted_by_metric, self.args.max_neighbours)
-        return frozenset(sorted_by_metric)
+        self, local: np.ndarray, candidates: np.ndarray, graph: Graph
+    ) -> np.ndarray:
+        metrics = self.metric(local, graph.positions[candidates])
+        count("metric_evaluations", len(metrics))
+        sorted_by_metric = np.argsort(metrics, kind="stable")
+        return candidates[sorted_by_metric[: self.args.max_neighbours]]
 
     @abstractmethod
-    def metric(
-        self, local: KeySpace, node: Node, others: FrozenSet[Node]
-    ) -> float:
+    def metric(self, local: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        """
+        Calculates the metric for each row of the `(N, D)` array `positions`,
+        where the metric of each row can depend on all of the other rows.
+
+        `positions` may have more leading axes, which `local` is broadcast
+        against, in which case the metric of each row depends on the other
+        rows of the same `(N, D)` array.
+        """
         raise NotImplementedError()
 
 
@@ -122,8 +210,8 @@ class Random(MetricNeighbourStrategy):
     Randomly selects neighbours.
     """
 
-    def metric(self, local: KeySpace, node: Node) -> float:
-        return random.random()
+    def metric(self, local: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        return np.random.random(positions.shape[:-1])
 
 
 class Closest(MetricNeighbourStrategy):
@@ -131,8 +219,23 @@ class Closest(MetricNeighbourStrategy):
     Selects the closest neighbours.
     """
 
-    def metric(self, local: KeySpace, node: Node) -> float:
-        return self.distance.distance(local, node.key_space)
+    def metric(self, local: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        return self.distance.distances(local, positions)
+
+    def apply_all(self, graph: Graph) -> Graph:
+        spatial_index = self.distance.spatial_index(graph.positions)
+        if spatial_index is None:
+            return super().apply_all(graph)
+
+        nearest = spatial_index.nearest(
+            np.arange(len(graph)), self.args.max_neighbours
+        )
+        # Only the distances to the returned nodes are counted, not those that
+        # the index calculates while searching
+        count("distance_evaluations", nearest.size)
+        connected_graph = Graph.empty(graph.positions, graph.max_neighbours)
+        connected_graph.neighbours[:, : nearest.shape[1]] = nearest
+        return connected_graph
 
 
 class ClosestRandom(MetricNeighbourStrategy):
@@ -140,19 +243,204 @@ class ClosestRandom(MetricNeighbourStrategy):
     Selects the closest neighbours with some randomness.
     """
 
-    def metric(self, local: KeySpace, node: Node) -> float:
-        return (
-            self.distance.distance(local, node.key_space)
-            + random.random() * self.distance.max_distance() * 0.1
+    def metric(self, local: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        return self.distance.distances(local, positions) + self.__noise(
+            positions.shape[:-1]
         )
 
+    def apply_all(self, graph: Graph) -> Graph:
+        spatial_index = self.distance.spatial_index(graph.positions)
+        if spatial_index is None or len(graph) <= 1:
+            return super().apply_all(graph)
+
+        connected_graph = Graph.empty(graph.positions, graph.max_neighbours)
+        for start in range(0, len(graph), APPLY_ALL_CHUNK_SIZE):
+            indices = np.arange(
+                start, min(start + APPLY_ALL_CHUNK_SIZE, len(graph))
+            )
+            self.__apply_chunk(graph, connected_graph, spatial_index, indices)
+        return connected_graph
+
+    def __apply_chunk(
+        self,
+        graph: Graph,
+        connected_graph: Graph,
+        spatial_index: SpatialIndex,
+        remaining: np.ndarray,
+    ) -> None:
+        # The noise added to the metric is non-negative, so a node's metric is
+        # never less than its distance. If the worst selected metric out of the
+        # `pool_size` nearest nodes is no more than the distance to the furthest
+        # of them, no node outside of the pool could have been selected.
+        # Otherwise, we grow the pool and try again, keeping the noise already
+        # drawn so that the selection is the same as checking every node.
+        noise = np.empty((len(remaining), 0))
+        pool_size = 2 * self.args.max_neighbours
+        while len(remaining) > 0:
+            nearest = spatial_index.nearest(remaining, pool_size)
+            distances = self.distance.distances(
+                graph.positions[remaining, np.newaxis, :],
+                graph.positions[nearest],
+            )
+            count("distance_evaluations", distances.size)
+            noise = np.hstack(
+                [
+                    noise,
+                    self.__noise(
+                        (len(remaining), nearest.shape[1] - noise.shape[1])
+                    ),
+                ]
+            )
+            metrics = distances + noise
+            sorted_by_metric = np.argsort(metrics, axis=1, kind="stable")[
+                :, : self.args.max_neighbours
+            ]
+            worst_selected = np.take_along_axis(
+                metrics, sorted_by_metric[:, -1:], axis=1
+            )[:, 0]
+            complete = (worst_selected <= distances[:, -1]) | (
+                nearest.shape[1] == len(graph) - 1
+            )
+
+            selected = np.take_along_axis(nearest, sorted_by_metric, axis=1)
+            connected_graph.neighbours[
+                remaining[complete], : selected.shape[1]
+            ] = selected[complete]
+            remaining = remaining[~complete]
+            noise = noise[~complete]
+            pool_size *= 2
+
+    def __noise(self, shape) -> np.ndarray:
+        return np.random.random(shape) * self.distance.max_distance() * 0.1
+
 
 class ClosestGaussian(MetricNeighbourStrategy):
     """
     Selects the closest neighbours with gaussian probability.
     """
 
-    def metric(self, local: KeySpace, node: Node) -> float:
-        distance_to_node = self.distance.distance(local, node.key_space)
-        gauss = abs(random.gauss(0, self.distance.max_distance()))
-        return 1 if gauss > distance_to_node else 0
+    def metric(self, local: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        distances_to_nodes = self.distance.distances(local, positions)
+        gauss = np.abs(
+            np.random.normal(
+                0, self.distance.max_distance(), size=positions.shape[:-1]
+            )
+        )
+        return (gauss > distances_to_nodes).astype(float)
+
+
+class AngleWeighted(ContextMetricNeighbourStrategy):
+    """
+    Selects neighbours using the same scores as the daemon's
+    `NeighboursStore`, which weights the distance to each neighbour against
+    the smallest angle between it and any other neighbour, so that close
+    neighbours in different directions are preferred.
+
+    Unlike the daemon, which removes the worst scoring neighbour one at a time,
+    all candidates are scored together and the best scoring are kept.
+
+    Scoring every node against every other node is cubic in the number of
+    nodes, so with a `SpatialIndex`, `apply_all` only scores each node's
+    `ANGLE_POOL_SIZE_FACTOR * max_neighbours` nearest nodes.
+    """
+
+    def __init__(
+        self,
+        distance: Distance,
+        args: GraphArgs,
+        distance_weighting: float = 0.5,
+        angle_weighting: float = 0.5,
+    ) -> None:
+        super().__init__(distance, args)
+        self.distance_weighting = distance_weighting
+        self.angle_weighting = angle_weighting
+
+    @staticmethod
+    def parse_weightings(weightings: str) -> Tuple[float, float]:
+        distance_weighting, angle_weighting = weightings.split(",")
+        return float(distance_weighting), float(angle_weighting)
+
+    def apply_all(self, graph: Graph) -> Graph:
+        spatial_index = self.distance.spatial_index(graph.positions)
+        if spatial_index is None:
+            return super().apply_all(graph)
+
+        connected_graph = Graph.empty(graph.positions, graph.max_neighbours)
+        pool_size = ANGLE_POOL_SIZE_FACTOR * self.args.max_neighbours
+        for start in range(0, len(graph), APPLY_ALL_CHUNK_SIZE):
+            indices = np.arange(
+                start, min(start + APPLY_ALL_CHUNK_SIZE, len(graph))
+            )
+            # Sorted so that ties in the metric are broken in the same order
+            # as `apply`
+            pool = np.sort(spatial_index.nearest(indices, pool_size), axis=1)
+            metrics = self.metric(
+                graph.positions[indices][:, np.newaxis, :],
+                graph.positions[pool],
+            )
+            count("metric_evaluations", metrics.size)
+            sorted_by_metric = np.argsort(metrics, axis=1, kind="stable")[
+                :, : self.args.max_neighbours
+            ]
+            selected = np.take_along_axis(pool, sorted_by_metric, axis=1)
+            connected_graph.neighbours[indices, : selected.shape[1]] = selected
+        return connected_graph
+
+    def metric(self, local: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        if positions.shape[-2] == 0:
+            return np.empty(positions.shape[:-1])
+
+        distances = self.distance.distances(local, positions)
+        min_distances = distances.min(axis=-1, keepdims=True)
+        distance_ranges = distances.max(axis=-1, keepdims=True) - min_distances
+        normalized_distances = np.divide(
+            distances - min_distances,
+            distance_ranges,
+            out=np.zeros(distances.shape),
+            where=distance_ranges > np.finfo(np.float32).eps,
+        )
+        normalized_angles = 1 - self.__min_angles(local, positions) / np.pi
+
+        return (
+            normalized_distances * self.distance_weighting
+            + normalized_angles * self.angle_weighting
+        ) / (self.distance_weighting + self.angle_weighting)
+
+    @staticmethod
+    def __min_angles(local: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        """
+        Gets the smallest angle around `local` between each position and any
+        other position that isn't in the same place.
+
+        As in the daemon, angles are taken between the raw differences in
+        position, without wrapping around key space. A position with no others
+        to compare against gets an angle of pi, so it scores as if it is in a
+        direction of its own.
+        """
+        # Positions may be integers, which could overflow when subtracted
+        relative = positions.astype(float) - local
+        norms = np.sqrt(np.sum(relative**2, axis=-1))
+        min_angles = np.empty(positions.shape[:-1])
+        for start in range(0, positions.shape[-2], ANGLE_CHUNK_SIZE):
+            chunk = slice(start, start + ANGLE_CHUNK_SIZE)
+            dots = relative[..., chunk, :] @ np.swapaxes(relative, -1, -2)
+            denominators = (
+                norms[..., chunk, np.newaxis] * norms[..., np.newaxis, :]
+            )
+            # A zero denominator means that a position is at `local`, in which
+            # case the daemon takes the angle to be zero
+            with np.errstate(divide="ignore", invalid="ignore"):
+                cos_angles = np.where(
+                    denominators == 0, 1.0, dots / denominators
+                )
+            same_place = np.all(
+                positions[..., chunk, np.newaxis, :]
+                == positions[..., np.newaxis, :, :],
+                axis=-1,
+            )
+            cos_angles[same_place] = -1.0
+            # The smallest angle has the largest cosine
+            min_angles[..., chunk] = np.arccos(
+                np.clip(cos_angles.max(axis=-1), -1.0, 1.0)
+            )
+        return min_angles
@@ -0,0 +1,150 @@
+import csv
+import json
+import math
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict
+
+from graph_experiments import (
+    StrategyArgs,
+    GraphArgs,
+    ConnectednessResults,
+)
+from graph_experiments.tester import REPORTED_PERCENTILES
+
+COLUMNS = [
+    ("neighbour_strategy_name", "string"),
+    ("distance_name", "string"),
+    ("test_strategy_name", "string"),
+    ("num_nodes", "int64"),
+    ("key_space_dimensions", "int64"),
+    ("max_neighbours", "int64"),
+    ("seed", "int64"),
+    ("successful_percent", "float64"),
+    ("mean_num_requests", "float64"),
+    ("num_searches", "int64"),
+    ("mean_search_time_sec", "float64"),
+    *((f"p{q}_num_requests", "float64") for q in REPORTED_PERCENTILES),
+    ("max_num_requests", "float64"),
+]
+"""The name and type of each column of the rows written by `ResultWriter`."""
+
+
+def get_row(
+    strategy_args: StrategyArgs,
+    graph_args: GraphArgs,
+    seed: int,
+    results: ConnectednessResults,
+) -> Dict[str, Any]:
+    """
+    Flattens the results of a cell into a row with the `COLUMNS`.
+    """
+    return {
+        **strategy_args._asdict(),
+        **graph_args._asdict(),
+        "seed": seed,
+        "successful_percent": results.successful_percent,
+        "mean_num_requests": results.mean_num_requests,
+        "num_searches": results.num_searches,
+        "mean_search_time_sec": results.mean_search_time_sec,
+        **{
+            f"p{q}_num_requests": results.percentile(q)
+            for q in REPORTED_PERCENTILES
+        },
+        "max_num_requests": results.percentile(100),
+    }
+
+
+class ResultWriter(ABC):
+    """
+    Writes the results of each cell as a row as soon as the cell finishes, so
+    that partial results of long sweeps can be read while they run, except
+    for Parquet.
+    """
+
+    @classmethod
+    def get(cls, output_format: str, path: Path) -> "ResultWriter":
+        if output_format == "csv":
+            return CsvWriter(path)
+        elif output_format == "jsonl":
+            return JsonlWriter(path)
+        elif output_format == "parquet":
+            return ParquetWriter(path)
+        else:
+            raise AssertionError(f"Unknown output format: {output_format}")
+
+    @abstractmethod
+    def write(self, row: Dict[str, Any]) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def close(self) -> None:
+        raise NotImplementedError()
+
+
+class CsvWriter(ResultWriter):
+    def __init__(self, path: Path) -> None:
+        self.__file = open(str(path), "w", newline="")
+        self.__writer = csv.DictWriter(
+            self.__file, fieldnames=[name for name, _ in COLUMNS]
+        )
+        self.__writer.writeheader()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self.__writer.writerow(row)
+        self.__file.flush()
+
+    def close(self) -> None:
+        self.__file.close()
+
+
+class JsonlWriter(ResultWriter):
+    """
+    Writes each row as a JSON object. Missing values, such as the percentiles
+    of a cell where every search failed, are NaN, which JSON can't represent,
+    so they're written as `null`.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.__file = open(str(path), "w")
+
+    def write(self, row: Dict[str, Any]) -> None:
+        row = {
+            name: (
+                None
+                if isinstance(value, float) and math.isnan(value)
+                else value
+            )
+            for name, value in row.items()
+        }
+        self.__file.write(json.dumps(row) + "\n")
+        self.__file.flush()
+
+    def close(self) -> None:
+        self.__file.close()
+
+
+class ParquetWriter(ResultWriter):
+    """
+    Writes each row as its own row group, but the file can only be read once
+    the writer is closed, as Parquet's footer is written last. Requires
+    `pyarrow`, which is only imported when this format is used.
+    """
+
+    def __init__(self, path: Path) -> None:
+        import pyarrow
+        import pyarrow.parquet
+
+        self.__pyarrow = pyarrow
+        self.__schema = pyarrow.schema(
+            [(name, pyarrow.type_for_alias(type_)) for name, type_ in COLUMNS]
+        )
+        self.__writer = pyarrow.parquet.ParquetWriter(str(path), self.__schema)
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self.__writer.write_table(
+            self.__pyarrow.Table.from_pylist([row], schema=self.__schema)
+        )
+
+    def close(self) -> None:
+        self.__writer.close()
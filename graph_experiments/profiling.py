@@ -0,0 +1,81 @@
+import cProfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Any
+
+COUNTERS: Counter = Counter()
+"""
+Running totals of the operations made in this process, added to by `count`.
+`Profile` records how much each phase adds to them.
+"""
+
+COUNTING = False
+"""
+Whether `count` adds to `COUNTERS`. This is only set during the phases of a
+`Profile` that counts operations, as counting costs time in hot loops.
+"""
+
+
+def count(name: str, n: int = 1) -> None:
+    """
+    Adds `n` operations to the counter `name`, if operations are being counted.
+    """
+    if COUNTING:
+        COUNTERS[name] += n
+
+
+class Profile:
+    """
+    Records the time taken by each phase of running a cell, and the counters
+    added to during each phase.
+
+    Counters are only added to if `count_operations` is true. If
+    `cprofile_path` is given, every phase also runs under `cProfile`, and the
+    combined stats are written to that path by `dump`.
+    """
+
+    def __init__(
+        self,
+        cprofile_path: Optional[Path] = None,
+        count_operations: bool = False,
+    ) -> None:
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.cprofile_path = cprofile_path
+        self.count_operations = count_operations
+        self.__cprofile = (
+            cProfile.Profile() if cprofile_path is not None else None
+        )
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        global COUNTING
+        counting_before = COUNTING
+        COUNTING = self.count_operations
+        counters_before = COUNTERS.copy()
+        if self.__cprofile is not None:
+            self.__cprofile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            time_sec = time.perf_counter() - start
+            if self.__cprofile is not None:
+                self.__cprofile.disable()
+            COUNTING = counting_before
+            phase = self.phases.setdefault(name, {"time_sec": 0.0})
+            phase["time_sec"] += time_sec
+            for counter, value in (COUNTERS - counters_before).items():
+                phase[counter] = phase.get(counter, 0) + value
+
+    def dump(self) -> None:
+        """
+        Writes the `cProfile` stats, if they were collected.
+        """
+        if self.__cprofile is not None:
+            self.cprofile_path.parent.mkdir(parents=True, exist_ok=True)
+            self.__cprofile.dump_stats(str(self.cprofile_path))
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"phases": self.phases}
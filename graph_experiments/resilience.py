@@ -0,0 +1,157 @@
+"""
+Measures how searches hold up against malicious nodes, as a fast analogue of
+the simulation's `ResilienceBenchmark`.
+
+Each graph is built once, and then tested with `graph-search` searches for
+each fraction of malicious nodes. Malicious nodes respond to queries as the
+`--adversary` does, and searches are made between honest nodes.
+
+For example, to compare the "closest" and "angle" neighbour strategies against
+nodes that never respond with any neighbours, run:
+
+  python -m graph_experiments.resilience \
+    --neighbour-strategy closest angle \
+    --distance wrapped \
+    --test-strategy all-knowing \
+    --num-nodes 1000 \
+    --adversary black-hole
+"""
+
+import random
+from argparse import ArgumentParser
+from itertools import product
+from typing import List, Dict
+
+import numpy as np
+
+from graph_experiments import (
+    Graph,
+    NeighbourStrategy,
+    TestStrategy,
+    Distance,
+    GraphArgs,
+    StrategyArgs,
+    TestArgs,
+)
+from graph_experiments.graph_search import SEARCH_BREADTH
+from graph_experiments.tester import ConnectednessResults, test_nodes
+
+MALICIOUS_FRACTIONS = [x / 10 for x in range(10)]
+"""Matches `MALICIOUS_PROBABILITIES` in the simulation."""
+
+
+def main():
+    parser = ArgumentParser("graph_experiments.resilience")
+    parser.add_argument(
+        "--neighbour-strategy", type=str, required=True, nargs="+"
+    )
+    parser.add_argument("--distance", type=str, required=True, nargs="+")
+    parser.add_argument("--test-strategy", type=str, required=True, nargs="+")
+    parser.add_argument("--num-nodes", type=int, default=100)
+    parser.add_argument("--key-space-dimensions", type=int, default=2)
+    parser.add_argument("--max-neighbours", type=int, default=10)
+    parser.add_argument(
+        "--adversary",
+        type=str,
+        choices=["black-hole", "random-response", "random-nodes"],
+        default="black-hole",
+    )
+    parser.add_argument(
+        "--malicious-fraction",
+        type=float,
+        default=MALICIOUS_FRACTIONS,
+        nargs="+",
+    )
+    parser.add_argument("--search-breadth", type=int, default=SEARCH_BREADTH)
+    parser.add_argument("--num-search-tests", type=int, default=100)
+    parser.add_argument("--num-graph-tests", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output-path", type=str, default="resilience.png")
+    parser_args = parser.parse_args()
+
+    if parser_args.seed is not None:
+        random.seed(parser_args.seed)
+        np.random.seed(parser_args.seed)
+
+    graph_args = GraphArgs(
+        parser_args.num_nodes,
+        parser_args.key_space_dimensions,
+        parser_args.max_neighbours,
+    )
+    all_strategy_args = [
+        StrategyArgs(*args)
+        for args in product(
+            parser_args.neighbour_strategy,
+            parser_args.distance,
+            parser_args.test_strategy,
+        )
+    ]
+
+    results_by_strategy = {}
+    for strategy_args in all_strategy_args:
+        distance = Distance.get(strategy_args.distance_name, graph_args)
+        neighbour_strategy = NeighbourStrategy.get(
+            strategy_args.neighbour_strategy_name, distance, graph_args
+        )
+        test_strategy = TestStrategy.get(strategy_args.test_strategy_name)
+        graph = Graph.random(graph_args, distance)
+        graph = test_strategy.apply(graph, neighbour_strategy)
+
+        all_results = []
+        for malicious_fraction in parser_args.malicious_fraction:
+            test_args = TestArgs(
+                parser_args.num_search_tests,
+                parser_args.num_graph_tests,
+                "graph-search",
+                search_breadth=parser_args.search_breadth,
+                malicious_fraction=malicious_fraction,
+                adversary_name=parser_args.adversary,
+            )
+            results = test_nodes(graph, distance, test_args)
+            print(
+                strategy_args,
+                graph_args,
+                f"malicious={malicious_fraction * 100:.0f}%",
+                results,
+                sep="\t",
+                flush=True,
+            )
+            all_results.append(results)
+        results_by_strategy[strategy_args] = all_results
+
+    __plot(
+        all_strategy_args,
+        parser_args.malicious_fraction,
+        results_by_strategy,
+        parser_args.output_path,
+    )
+
+
+def __plot(
+    all_strategy_args: List[StrategyArgs],
+    malicious_fractions: List[float],
+    results_by_strategy: Dict[StrategyArgs, List[ConnectednessResults]],
+    output_path: str,
+) -> None:
+    # Imported here as importing `matplotlib` is slow, and isn't needed to run
+    # the tests
+    import matplotlib.pyplot as plt
+
+    for strategy_args in all_strategy_args:
+        plt.plot(
+            [f * 100 for f in malicious_fractions],
+            [
+                r.successful_percent * 100
+                for r in results_by_strategy[strategy_args]
+            ],
+        )
+
+    plt.xlabel("Malicious probability (%)")
+    plt.ylabel("Successful searches (%)")
+    plt.legend(all_strategy_args)
+    plt.savefig(output_path)
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import math
+from abc import ABC, abstractmethod
+from typing import NamedTuple, Tuple, List
+
+import numpy as np
+
+
+class ScalingModel(ABC):
+    """
+    A model of how the mean number of requests made by a search scales with
+    the number of nodes, for a fixed number of dimensions and neighbours.
+    """
+
+    def __init__(self, key_space_dimensions: int, max_neighbours: int):
+        self.key_space_dimensions = key_space_dimensions
+        self.max_neighbours = max_neighbours
+
+    @classmethod
+    def get(
+        cls, name: str, key_space_dimensions: int, max_neighbours: int
+    ) -> "ScalingModel":
+        if name == "analytical":
+            return Analytical(key_space_dimensions, max_neighbours)
+        elif name == "log":
+            return Log(key_space_dimensions, max_neighbours)
+        elif name == "power":
+            return Power(key_space_dimensions, max_neighbours)
+        else:
+            raise AssertionError(f"Unknown scaling model: {name}")
+
+    @abstractmethod
+    def fit(
+        self, num_nodes: np.ndarray, mean_num_requests: np.ndarray
+    ) -> Tuple[float, ...]:
+        """
+        Fits the model's parameters to the measured mean number of requests
+        for each number of nodes.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def predict(
+        self, parameters: Tuple[float, ...], num_nodes: np.ndarray
+    ) -> np.ndarray:
+        """
+        Predicts the mean number of requests for each number of nodes.
+        """
+        raise NotImplementedError()
+
+
+class Analytical(ScalingModel):
+    """
+    The estimate `q = l / l'` from `docs/performance.md`, generalized from 2
+    dimensions by using the volume of a `D`-ball for the area around a node.
+
+    The estimate is multiplied by a fitted scale, so a scale close to 1 means
+    that the estimate agrees with the measurements.
+    """
+
+    def fit(
+        self, num_nodes: np.ndarray, mean_num_requests: np.ndarray
+    ) -> Tuple[float, ...]:
+        estimates = self.estimate(num_nodes)
+        # Least squares fit of `scale * estimates` to the measurements
+        scale = np.dot(estimates, mean_num_requests) / np.dot(
+            estimates, estimates
+        )
+        return (float(scale),)
+
+    def predict(
+        self, parameters: Tuple[float, ...], num_nodes: np.ndarray
+    ) -> np.ndarray:
+        (scale,) = parameters
+        return scale * self.estimate(num_nodes)
+
+    def estimate(self, num_nodes: np.ndarray) -> np.ndarray:
+        """
+        Estimates the mean number of requests for each number of nodes, with
+        the width of key space set to 1.
+        """
+        dimensions = self.key_space_dimensions
+        search_distance = 1 / 4
+        unit_ball_volume = math.pi ** (dimensions / 2) / math.gamma(
+            dimensions / 2 + 1
+        )
+        radius = (
+            self.max_neighbours
+            / (unit_ball_volume * np.asarray(num_nodes, dtype=float))
+        ) ** (1 / dimensions)
+        angle = (1 - self.max_neighbours / (self.max_neighbours + 1)) * math.pi
+        query_distance = math.cos(angle) * radius
+        return search_distance / query_distance
+
+
+class Log(ScalingModel):
+    """
+    Fits `a + b * log(N)`.
+    """
+
+    def fit(
+        self, num_nodes: np.ndarray, mean_num_requests: np.ndarray
+    ) -> Tuple[float, ...]:
+        b, a = np.polyfit(np.log(num_nodes), mean_num_requests, 1)
+        return float(a), float(b)
+
+    def predict(
+        self, parameters: Tuple[float, ...], num_nodes: np.ndarray
+    ) -> np.ndarray:
+        a, b = parameters
+        return a + b * np.log(num_nodes)
+
+
+class Power(ScalingModel):
+    """
+    Fits `a * N ** b`, by fitting a line in log-log space.
+    """
+
+    def fit(
+        self, num_nodes: np.ndarray, mean_num_requests: np.ndarray
+    ) -> Tuple[float, ...]:
+        b, log_a = np.polyfit(np.log(num_nodes), np.log(mean_num_requests), 1)
+        return float(np.exp(log_a)), float(b)
+
+    def predict(
+        self, parameters: Tuple[float, ...], num_nodes: np.ndarray
+    ) -> np.ndarray:
+        a, b = parameters
+        return a * np.asarray(num_nodes, dtype=float) ** b
+
+
+SCALING_MODEL_NAMES = ("analytical", "log", "power")
+"""The names of the models fitted by `fit_scaling`."""
+
+
+class ScalingFit(NamedTuple):
+    model_name: str
+    parameters: Tuple[float, ...]
+    # Root mean square error of the fit over the measurements
+    rms_error: float
+    # Predicted mean number of requests for each of the `predict_num_nodes`
+    # given to `fit_scaling`
+    predictions: Tuple[float, ...]
+
+    def __str__(self) -> str:
+        return ",".join(
+            [
+                self.model_name,
+                "params=" + "/".join(f"{p:.4g}" for p in self.parameters),
+                f"rms={self.rms_error:.3f}",
+                *(f"pred={p:.2f}" for p in self.predictions),
+            ]
+        )
+
+
+def fit_scaling(
+    num_nodes: List[int],
+    mean_num_requests: List[float],
+    key_space_dimensions: int,
+    max_neighbours: int,
+    predict_num_nodes: List[int],
+) -> List[ScalingFit]:
+    """
+    Fits each scaling model to the measured mean number of requests for each
+    number of nodes, and extrapolates to `predict_num_nodes`.
+
+    Measurements with no successful searches are ignored. Models are only
+    fitted if there are at least two different numbers of nodes left.
+    """
+    num_nodes_array = np.asarray(num_nodes, dtype=float)
+    mean_num_requests_array = np.asarray(mean_num_requests, dtype=float)
+    measured = mean_num_requests_array > 0
+    num_nodes_array = num_nodes_array[measured]
+    mean_num_requests_array = mean_num_requests_array[measured]
+    if len(np.unique(num_nodes_array)) < 2:
+        return []
+
+    fits = []
+    for name in SCALING_MODEL_NAMES:
+        model = ScalingModel.get(name, key_space_dimensions, max_neighbours)
+        parameters = model.fit(num_nodes_array, mean_num_requests_array)
+        errors = (
+            model.predict(parameters, num_nodes_array)
+            - mean_num_requests_array
+        )
+        fits.append(
+            ScalingFit(
+                name,
+                parameters,
+                float(np.sqrt(np.mean(errors**2))),
+                tuple(
+                    model.predict(
+                        parameters, np.asarray(predict_num_nodes, dtype=float)
+                    ).tolist()
+                ),
+            )
+        )
+    return fits
@@ -0,0 +1,62 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from graph_experiments import constants
+from graph_experiments.profiling import count
+
+
+class SpatialIndex:
+    """
+    Finds the nearest nodes to each other in key space using a k-d tree.
+
+    `p` is the order of the Minkowski distance used (i.e. 1 for Manhattan
+    distance, 2 for euclidean distance). If `wrapped` is true, the tree is
+    periodic so that distances wrap around the edges of key space, which starts
+    at `lower` and is `width` wide in each dimension.
+    """
+
+    def __init__(
+        self,
+        positions: np.ndarray,
+        p: float,
+        wrapped: bool,
+        lower: float = constants.KEY_SPACE_LOWER,
+        width: float = constants.KEY_SPACE_WIDTH,
+    ):
+        self.p = p
+        if wrapped:
+            # Periodic trees need all points to be in `[0, boxsize)`. Positions
+            # are converted to floats first so that integer positions can't
+            # overflow.
+            self.__tree = cKDTree(
+                np.mod(positions.astype(float) - lower, width), boxsize=width
+            )
+        else:
+            self.__tree = cKDTree(positions)
+
+    def __len__(self) -> int:
+        return self.__tree.n
+
+    def nearest(self, indices: np.ndarray, k: int) -> np.ndarray:
+        """
+        Gets the `k` nearest other nodes for each node in `indices`, as an
+        `(len(indices), k)` array sorted from nearest to furthest.
+
+        `k` is capped to the number of other nodes.
+        """
+        k = min(k, len(self) - 1)
+        count("spatial_index_queries", len(indices))
+        if k <= 0:
+            return np.empty((len(indices), 0), dtype=np.int32)
+        _, nearest = self.__tree.query(
+            self.__tree.data[indices], k=k + 1, p=self.p
+        )
+        nearest = nearest.reshape(len(indices), k + 1)
+
+        # Remove each node from its own results. The node is normally first,
+        # but may not be if other nodes are in the same position, in which case
+        # we drop the furthest result instead.
+        is_self = nearest == indices[:, np.newaxis]
+        not_self_first = np.argsort(is_self, axis=1, kind="stable")
+        nearest = np.take_along_axis(nearest, not_self_first, axis=1)
+        return nearest[:, :k].astype(np.int32)
@@ -1,7 +1,16 @@
+import bisect
+import heapq
 from abc import ABC, abstractmethod
-from typing import FrozenSet
+from typing import List, Set, Tuple, Optional
 
-from graph_experiments import Node, NeighbourStrategy
+import numpy as np
+
+from graph_experiments import Graph, NeighbourStrategy
+from graph_experiments.graph import NO_NEIGHBOUR
+from graph_experiments.profiling import count
+
+CONNECT_SEARCH_BREADTH = 3
+"""Matches `DEFAULT_CONNECT_SEARCH_BREADTH` in the daemon."""
 
 
 class TestStrategy(ABC):
@@ -9,19 +18,22 @@ class TestStrategy(ABC):
     def get(cls, name: str) -> "TestStrategy":
         if name == "all-knowing":
             return AllKnowing()
+        elif name == "joining":
+            return Joining()
         else:
             raise AssertionError(f"Unknown test strategy: {name}")
 
     @abstractmethod
     def apply(
-        self, nodes: FrozenSet[Node], neighbour_strategy: NeighbourStrategy
-    ) -> FrozenSet[Node]:
+        self, graph: Graph, neighbour_strategy: NeighbourStrategy
+    ) -> Graph:
         """
-        Connects the input nodes together in some way, using a
+        Connects the nodes in the input graph together in some way, using a
         `NeighbourStrategy`.
 
-        `Node.neighbours` must not be modified by this method - this method
-        should only chose which new nodes to expose to the `NeighbourStrategy`.
+        `graph` must not be modified by this method - this method should only
+        chose which new nodes to expose to the `NeighbourStrategy`, and return
+        the connected graph.
         """
         raise NotImplementedError()
 
@@ -33,11 +45,304 @@ class AllKnowing(TestStrategy):
     """
 
     def apply(
-        self, nodes: FrozenSet[Node], neighbour_strategy: NeighbourStrategy
-    ) -> FrozenSet[Node]:
-        return frozenset(
-            neighbour_strategy.apply(
-                node, frozenset(n for n in nodes if n is not node), nodes
+        self, graph: Graph, neighbour_strategy: NeighbourStrategy
+    ) -> Graph:
+        return neighbour_strategy.apply_all(graph)
+
+
+class Joining(TestStrategy):
+    """
+    Nodes join the network one at a time, as they do when connecting to a real
+    network. Each joining node connects through a random node already in the
+    network by searching for itself.
+
+    As in the daemon, the joining node considers every node found during the
+    search as a neighbour, and every node queried during the search considers
+    the joining node as a neighbour. Only these nodes are updated, so each join
+    costs a single search.
+    """
+
+    def apply(
+        self, graph: Graph, neighbour_strategy: NeighbourStrategy
+    ) -> Graph:
+        connected_graph = graph.copy()
+        for index in range(1, len(graph)):
+            self.join(
+                connected_graph,
+                np.array([index]),
+                np.array([np.random.randint(index)]),
+                neighbour_strategy,
+            )
+        return connected_graph
+
+    @staticmethod
+    def join(
+        graph: Graph,
+        indices: np.ndarray,
+        connect_indices: np.ndarray,
+        neighbour_strategy: NeighbourStrategy,
+        alive: Optional[np.ndarray] = None,
+    ) -> None:
+        """
+        Joins each node in `indices` by searching for it from the node at the
+        same position in `connect_indices`, until the `CONNECT_SEARCH_BREADTH`
+        closest found nodes have been explored.
+
+        The searches run concurrently, in lockstep, with each search exploring
+        one node per step. Joining nodes can find each other, and see the
+        neighbours that each other have considered so far.
+
+        If given, `alive` is a boolean mask of the nodes that respond to
+        requests. Requests to other nodes fail, so they return no neighbours
+        and don't consider the joining node, and the joining node doesn't
+        consider them as neighbours as it can't verify them.
+        """
+        if alive is None:
+            alive = np.ones(len(graph), dtype=bool)
+        if len(indices) == 1:
+            # A heap has less overhead than the lockstep arrays for one search
+            Joining.__join_one(
+                graph,
+                int(indices[0]),
+                int(connect_indices[0]),
+                neighbour_strategy,
+                alive,
+            )
+            return
+
+        distance = neighbour_strategy.distance
+        searches = np.arange(len(indices))
+
+        # The closest unexplored node is explored next, so a search only ever
+        # explores its `CONNECT_SEARCH_BREADTH` closest found nodes, as
+        # otherwise they have all been explored and the search has finished.
+        # Only these nodes are kept, sorted by their distance to the joining
+        # node, in place of a heap of every found node.
+        closest = np.full(
+            (len(indices), CONNECT_SEARCH_BREADTH),
+            NO_NEIGHBOUR,
+            dtype=np.int64,
+        )
+        closest_distances = np.full(closest.shape, np.inf)
+        explored = np.zeros(closest.shape, dtype=bool)
+        closest[:, 0] = connect_indices
+        closest_distances[:, 0] = distance.distances(
+            graph.positions[indices], graph.positions[connect_indices]
+        )
+        # Bit `node % 64` of `found[search, node // 64]` is set once the search
+        # has found the node, taking `len(indices) * len(graph) / 8` bytes
+        found = np.zeros(
+            (len(indices), (len(graph) + 63) // 64), dtype=np.uint64
+        )
+        Joining.__set_found(found, searches, indices)
+        Joining.__set_found(found, searches, connect_indices)
+        connecting = alive[connect_indices]
+        Joining.__consider(
+            graph,
+            indices[connecting],
+            connect_indices[connecting, np.newaxis],
+            neighbour_strategy,
+        )
+
+        searching = searches
+        while True:
+            unexplored = (closest[searching] != NO_NEIGHBOUR) & ~explored[
+                searching
+            ]
+            still_searching = np.any(unexplored, axis=1)
+            searching = searching[still_searching]
+            if len(searching) == 0:
+                return
+            explore_columns = np.argmax(unexplored[still_searching], axis=1)
+            exploring = closest[searching, explore_columns]
+            explored[searching, explore_columns] = True
+            joining = indices[searching]
+            responding = alive[exploring]
+            count("nodes_visited", len(exploring))
+
+            # As in the daemon, the queried nodes consider the joining nodes
+            # before responding
+            Joining.__consider(
+                graph,
+                exploring[responding],
+                joining[responding, np.newaxis],
+                neighbour_strategy,
+            )
+            responses = np.where(
+                responding[:, np.newaxis],
+                graph.neighbours[exploring],
+                NO_NEIGHBOUR,
             )
-            for node in nodes
+
+            # Find the new nodes in each response, and add them to `found`
+            rows, columns = np.nonzero(responses != NO_NEIGHBOUR)
+            nodes = responses[rows, columns]
+            found_before = Joining.__is_found(found, searching[rows], nodes)
+            Joining.__set_found(found, searching[rows], nodes)
+            rows, columns = rows[~found_before], columns[~found_before]
+            new_neighbours = np.full(responses.shape, NO_NEIGHBOUR)
+            new_neighbours[rows, columns] = responses[rows, columns]
+
+            # The joining nodes consider the new nodes that they can verify
+            verified = (new_neighbours != NO_NEIGHBOUR) & alive[new_neighbours]
+            considering = np.any(verified, axis=1)
+            Joining.__consider(
+                graph,
+                joining[considering],
+                np.where(verified, new_neighbours, NO_NEIGHBOUR)[considering],
+                neighbour_strategy,
+            )
+
+            new_distances = np.full(responses.shape, np.inf)
+            new_distances[rows, columns] = distance.distances(
+                graph.positions[joining[rows]],
+                graph.positions[new_neighbours[rows, columns]],
+            )
+            count("distance_evaluations", len(rows))
+
+            # Keep the closest found nodes of the searches that found new
+            # nodes, breaking ties by index as a heap of `(distance, index)`
+            # would. Empty entries have an infinite distance, so they sort last.
+            updating = np.unique(rows)
+            updated = searching[updating]
+            candidates = np.concatenate(
+                [closest[updated], new_neighbours[updating]], axis=1
+            )
+            candidate_distances = np.concatenate(
+                [closest_distances[updated], new_distances[updating]], axis=1
+            )
+            candidate_explored = np.concatenate(
+                [
+                    explored[updated],
+                    np.zeros((len(updated), responses.shape[1]), dtype=bool),
+                ],
+                axis=1,
+            )
+            kept = (
+                np.arange(len(updated))[:, np.newaxis],
+                np.lexsort((candidates, candidate_distances), axis=1)[
+                    :, :CONNECT_SEARCH_BREADTH
+                ],
+            )
+            closest[updated] = candidates[kept]
+            closest_distances[updated] = candidate_distances[kept]
+            explored[updated] = candidate_explored[kept]
+
+    @staticmethod
+    def __join_one(
+        graph: Graph,
+        index: int,
+        connect_index: int,
+        neighbour_strategy: NeighbourStrategy,
+        alive: np.ndarray,
+    ) -> None:
+        """
+        Joins the node at `index` in the same way as `join`, using a heap of
+        the nodes to explore.
+        """
+        distance = neighbour_strategy.distance
+        position = graph.positions[index]
+
+        def consider(index_: int, candidates: np.ndarray) -> None:
+            graph.set_neighbours(
+                index_, neighbour_strategy.apply(graph, index_, candidates)
+            )
+
+        connect_distance = float(
+            distance.distances(position, graph.positions[connect_index])
+        )
+        found: Set[int] = {index, connect_index}
+        explored: Set[int] = set()
+        to_explore: List[Tuple[float, int]] = [
+            (connect_distance, connect_index)
+        ]
+        closest_found: List[Tuple[float, int]] = [
+            (connect_distance, connect_index)
+        ]
+        if alive[connect_index]:
+            consider(index, np.array([connect_index]))
+        while to_explore:
+            _, exploring = heapq.heappop(to_explore)
+            explored.add(exploring)
+            count("nodes_visited")
+            count("heap_operations")
+            new_neighbours = []
+            if alive[exploring]:
+                # The queried node receives a request from the joining node
+                consider(exploring, np.array([index]))
+                new_neighbours = [
+                    n
+                    for n in graph.neighbours_of(exploring).tolist()
+                    if n not in found
+                ]
+            if new_neighbours:
+                found.update(new_neighbours)
+                verified = [n for n in new_neighbours if alive[n]]
+                if verified:
+                    consider(index, np.array(verified))
+                new_distances = distance.distances(
+                    position, graph.positions[new_neighbours]
+                ).tolist()
+                count("distance_evaluations", len(new_neighbours))
+                count("heap_operations", len(new_neighbours))
+                for new_distance, new_neighbour in zip(
+                    new_distances, new_neighbours
+                ):
+                    heapq.heappush(to_explore, (new_distance, new_neighbour))
+                    bisect.insort(closest_found, (new_distance, new_neighbour))
+                del closest_found[CONNECT_SEARCH_BREADTH:]
+
+            if len(closest_found) == CONNECT_SEARCH_BREADTH and all(
+                n in explored for _, n in closest_found
+            ):
+                return
+
+    @staticmethod
+    def __is_found(
+        found: np.ndarray, searches: np.ndarray, nodes: np.ndarray
+    ) -> np.ndarray:
+        bits = found[searches, nodes // 64] >> (nodes % 64).astype(np.uint64)
+        return (bits & np.uint64(1)).astype(bool)
+
+    @staticmethod
+    def __set_found(
+        found: np.ndarray, searches: np.ndarray, nodes: np.ndarray
+    ) -> None:
+        np.bitwise_or.at(
+            found,
+            (searches, nodes // 64),
+            np.uint64(1) << (nodes % 64).astype(np.uint64),
         )
+
+    @staticmethod
+    def __consider(
+        graph: Graph,
+        indices: np.ndarray,
+        candidates: np.ndarray,
+        neighbour_strategy: NeighbourStrategy,
+    ) -> None:
+        """
+        Has each node in `indices` consider the potential new neighbours in the
+        same row of `candidates`, which is padded with `NO_NEIGHBOUR`. A node
+        that appears several times in `indices` considers each row in turn.
+        """
+        if len(indices) == 1:
+            # Batching has more overhead than it saves for a single node
+            index = int(indices[0])
+            graph.set_neighbours(
+                index,
+                neighbour_strategy.apply(
+                    graph, index, candidates[0][candidates[0] != NO_NEIGHBOUR]
+                ),
+            )
+            return
+        remaining = np.arange(len(indices))
+        while len(remaining) > 0:
+            _, first = np.unique(indices[remaining], return_index=True)
+            considering = remaining[first]
+            graph.neighbours[indices[considering]] = (
+                neighbour_strategy.apply_candidates(
+                    graph, indices[considering], candidates[considering]
+                )
+            )
+            remaining = np.delete(remaining, first)
@@ -1,75 +1,527 @@
+import heapq
 import random
-from itertools import permutations
-from typing import NamedTuple, FrozenSet, Optional, Set
+from typing import NamedTuple, Optional, Set, List, Tuple, Iterator, Callable
 
-from graph_experiments import Node, Distance, TestArgs
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.stats
+
+from graph_experiments import (
+    Graph,
+    Distance,
+    TestArgs,
+    Adversary,
+    Latency,
+    GraphSearch,
+)
+from graph_experiments.graph_search import SearchResult
+from graph_experiments.profiling import count
+from graph_experiments.graph import NO_NEIGHBOUR
+
+SEARCH_BATCH_SIZE = 65536
+"""The maximum number of searches to run at once in batched searches."""
+
+REPORTED_PERCENTILES = (50, 90, 99)
+"""The percentiles of the number of requests to report, with intervals."""
+
+BOOTSTRAP_NUM_RESAMPLES = 1000
+"""The number of resamples used for bootstrap confidence intervals."""
+
+BOOTSTRAP_CONFIDENCE = 0.95
+"""The confidence level of bootstrap confidence intervals."""
+
+BOOTSTRAP_SEED = 0
+"""Seed for bootstrap resampling, so that intervals are reproducible."""
+
+INTERVAL_CONFIDENCE = 0.95
+"""The confidence level of the intervals used to stop adaptive tests."""
+
+ADAPTIVE_BATCH_SIZE = 1024
+"""The number of searches to run between checks of adaptive tests' targets."""
+
+REACHABILITY_CHECK_NUM_EXPLORED = 1000
+"""
+The number of nodes a best-first search explores before checking that its
+target can be reached at all, as a failed search explores every node that it
+can reach.
+"""
 
 
 class ConnectednessResults(NamedTuple):
     successful_percent: float
     mean_num_requests: float
+    # Number of successful searches that made each number of requests, indexed
+    # by the number of requests
+    num_requests_histogram: Tuple[int, ...] = ()
+    # Number of searches made, including failed searches
+    num_searches: int = 0
+    # Mean simulated time taken by successful searches, if they were timed
+    mean_search_time_sec: Optional[float] = None
 
     def __str__(self) -> str:
         return ",".join(
             [
                 f"{self.successful_percent * 100:.2f}%",
+                f"n={self.num_searches}",
                 f"avg={self.mean_num_requests:.2f}",
+                *(
+                    [f"time={self.mean_search_time_sec:.3f}s"]
+                    if self.mean_search_time_sec is not None
+                    else []
+                ),
+                *(self.__format_percentile(q) for q in REPORTED_PERCENTILES),
+                f"max={self.percentile(100):.0f}",
             ]
         )
 
+    def with_searches(
+        self,
+        num_requests: np.ndarray,
+        search_times_sec: Optional[np.ndarray] = None,
+    ) -> "ConnectednessResults":
+        """
+        Adds more searches to the results, given the number of requests made
+        by each search, or zero for failed searches, and optionally the time
+        taken by each search.
+        """
+        old_histogram = np.asarray(self.num_requests_histogram, dtype=np.int64)
+        new_histogram = np.bincount(num_requests[num_requests > 0])
+        histogram = np.zeros(
+            max(len(old_histogram), len(new_histogram)), dtype=np.int64
+        )
+        histogram[: len(old_histogram)] += old_histogram
+        histogram[: len(new_histogram)] += new_histogram
+
+        num_searches = self.num_searches + len(num_requests)
+        num_successful = int(histogram.sum())
+        mean_search_time_sec = None
+        if search_times_sec is not None:
+            total_search_time_sec = (self.mean_search_time_sec or 0) * int(
+                old_histogram.sum()
+            ) + float(search_times_sec[num_requests > 0].sum())
+            mean_search_time_sec = (
+                total_search_time_sec / num_successful
+                if num_successful > 0
+                else 0
+            )
+        return ConnectednessResults(
+            num_successful / num_searches if num_searches > 0 else 0,
+            (
+                float(np.dot(np.arange(len(histogram)), histogram))
+                / num_successful
+                if num_successful > 0
+                else 0
+            ),
+            tuple(histogram.tolist()),
+            num_searches,
+            mean_search_time_sec,
+        )
+
+    def success_interval_width(
+        self, confidence: float = INTERVAL_CONFIDENCE
+    ) -> float:
+        """
+        Gets the width of the Wilson score interval for `successful_percent`,
+        which unlike the normal approximation isn't zero when all or none of
+        the searches are successful.
+        """
+        if self.num_searches == 0:
+            return float("inf")
+        z = scipy.stats.norm.ppf((1 + confidence) / 2)
+        n = self.num_searches
+        p = self.successful_percent
+        return float(
+            2
+            * z
+            / (1 + z**2 / n)
+            * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2))
+        )
+
+    def mean_interval_width(
+        self, confidence: float = INTERVAL_CONFIDENCE
+    ) -> float:
+        """
+        Gets the width of the normal approximation interval for
+        `mean_num_requests`.
+        """
+        histogram = np.asarray(self.num_requests_histogram, dtype=np.int64)
+        num_successful = int(histogram.sum())
+        if num_successful < 2:
+            return float("inf")
+        values = np.arange(len(histogram))
+        variance = np.dot(
+            histogram, (values - self.mean_num_requests) ** 2
+        ) / (num_successful - 1)
+        z = scipy.stats.norm.ppf((1 + confidence) / 2)
+        return float(2 * z * np.sqrt(variance / num_successful))
+
+    def __format_percentile(self, q: float) -> str:
+        lower, upper = self.percentile_interval(q)
+        return f"p{q}={self.percentile(q):.0f}[{lower:.0f},{upper:.0f}]"
+
+    def percentile(self, q: float) -> float:
+        """
+        Gets the `q`th percentile of the number of requests made by successful
+        searches, or NaN if no searches were successful.
+        """
+        histogram = np.asarray(self.num_requests_histogram, dtype=np.int64)
+        if histogram.sum() == 0:
+            return float("nan")
+        return float(
+            self.__histogram_percentiles(histogram[np.newaxis, :], q)[0]
+        )
+
+    def percentile_interval(
+        self,
+        q: float,
+        confidence: float = BOOTSTRAP_CONFIDENCE,
+        num_resamples: int = BOOTSTRAP_NUM_RESAMPLES,
+    ) -> Tuple[float, float]:
+        """
+        Gets a bootstrap confidence interval for `percentile(q)`.
+
+        Resampling the searches is the same as drawing a histogram from a
+        multinomial distribution with the observed frequencies, so each
+        resample only takes the memory of a histogram. The resamples are
+        seeded so that the interval is the same each time it is reported.
+        """
+        histogram = np.asarray(self.num_requests_histogram, dtype=np.int64)
+        num_successful = int(histogram.sum())
+        if num_successful == 0:
+            return float("nan"), float("nan")
+        resamples = np.random.RandomState(BOOTSTRAP_SEED).multinomial(
+            num_successful, histogram / num_successful, size=num_resamples
+        )
+        percentiles = self.__histogram_percentiles(resamples, q)
+        lower, upper = np.quantile(
+            percentiles, [(1 - confidence) / 2, (1 + confidence) / 2]
+        )
+        return float(lower), float(upper)
+
+    @staticmethod
+    def __histogram_percentiles(
+        histograms: np.ndarray, q: float
+    ) -> np.ndarray:
+        """
+        Gets the `q`th percentile of each row of `histograms`, where each row
+        counts the occurrences of each value. This is the lowest value with at
+        least `q` percent of occurrences at or below it.
+        """
+        totals = histograms.sum(axis=1)
+        cumulative = np.cumsum(histograms, axis=1)
+        rank = np.maximum(np.ceil(totals * q / 100), 1)
+        percentiles = np.argmax(cumulative >= rank[:, np.newaxis], axis=1)
+        return np.where(totals > 0, percentiles, np.nan)
+
 
 def test_nodes(
-    nodes: FrozenSet[Node], distance: Distance, args: TestArgs
+    graph: Graph,
+    distance: Distance,
+    args: TestArgs,
+    nodes: Optional[np.ndarray] = None,
 ) -> "ConnectednessResults":
+    """
+    Tests searching between nodes of `graph`, pooling the searches from all of
+    the graph tests. If `nodes` is given, only searches between those nodes
+    are tested. If `args` has malicious nodes, they are picked at random for
+    each graph test, and only searches between honest nodes are tested.
+
+    Only a histogram of the number of requests is kept, so memory use doesn't
+    grow with the number of searches. If `args` has target interval widths,
+    searches stop as soon as both intervals are narrow enough.
+    """
     assert args.num_graph_tests > 0
-    results = [
-        __run_test(nodes, distance, args) for _ in range(args.num_graph_tests)
-    ]
-    return ConnectednessResults(
-        sum(r.successful_percent for r in results) / len(results),
-        sum(r.mean_num_requests for r in results) / len(results),
+    assert not (args.all_pairs and __is_adaptive(args))
+    results = ConnectednessResults(0, 0)
+    for _ in range(args.num_graph_tests):
+        malicious = None
+        searched_nodes = nodes
+        if args.malicious_fraction > 0:
+            malicious = np.random.random(len(graph)) < args.malicious_fraction
+            if searched_nodes is None:
+                searched_nodes = np.arange(len(graph))
+            searched_nodes = searched_nodes[~malicious[searched_nodes]]
+
+        for from_indices, to_indices in __get_search_pairs(
+            len(graph) if searched_nodes is None else len(searched_nodes),
+            args,
+        ):
+            if searched_nodes is not None:
+                from_indices = searched_nodes[from_indices]
+                to_indices = searched_nodes[to_indices]
+            # Number of requests made by each search, or zero if it failed,
+            # and the time taken by each search if searches are timed
+            num_requests, search_times_sec = __search_batch(
+                from_indices, to_indices, graph, distance, args, malicious
+            )
+            results = results.with_searches(num_requests, search_times_sec)
+            if __is_adaptive(args) and __reached_targets(results, args):
+                return results
+    return results
+
+
+def __is_adaptive(args: TestArgs) -> bool:
+    return (
+        args.success_interval_width is not None
+        or args.mean_interval_width is not None
     )
 
 
-def __run_test(
-    nodes: FrozenSet[Node], distance: Distance, args: TestArgs
-) -> "ConnectednessResults":
-    search_node_pairs = list(permutations(nodes, 2))
-    search_node_pairs = random.sample(
-        search_node_pairs, k=min(args.num_search_tests, len(search_node_pairs))
+def __reached_targets(results: ConnectednessResults, args: TestArgs) -> bool:
+    return (
+        args.success_interval_width is None
+        or results.success_interval_width() <= args.success_interval_width
+    ) and (
+        args.mean_interval_width is None
+        or results.mean_interval_width() <= args.mean_interval_width
     )
-    results = [
-        __search(from_node, to_node, nodes, distance)
-        for from_node, to_node in search_node_pairs
-    ]
-    results_success = list(filter(None, results))
-    successful_percent = len(results_success) / len(results) if results else 0
-    mean_num_requests = (
-        sum(results_success) / len(results_success) if results_success else 0
+
+
+def __get_search_pairs(
+    num_nodes: int, args: TestArgs
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Gets batches of `(from_indices, to_indices)` to search between, out of
+    `num_nodes` nodes.
+    """
+    if num_nodes < 2:
+        return
+    if args.all_pairs:
+        sources_per_batch = max(1, SEARCH_BATCH_SIZE // (num_nodes - 1))
+        for start in range(0, num_nodes, sources_per_batch):
+            from_indices = np.arange(
+                start, min(start + sources_per_batch, num_nodes)
+            )
+            # Every other node, skipping each source node
+            to_indices = np.arange(num_nodes - 1)[np.newaxis, :]
+            to_indices = to_indices + (to_indices >= from_indices[:, None])
+            yield np.repeat(from_indices, num_nodes - 1), to_indices.ravel()
+        return
+
+    # Sample from the indices of the pairs, rather than the pairs themselves,
+    # so that the pairs aren't all held in memory
+    num_pairs = num_nodes * (num_nodes - 1)
+    pair_indices = random.sample(
+        range(num_pairs), k=min(args.num_search_tests, num_pairs)
+    )
+    # The sample is in a random order, so stopping adaptive tests after any
+    # batch still leaves a uniform sample
+    batch_size = (
+        ADAPTIVE_BATCH_SIZE if __is_adaptive(args) else SEARCH_BATCH_SIZE
     )
-    return ConnectednessResults(successful_percent, mean_num_requests)
+    for start in range(0, len(pair_indices), batch_size):
+        batch = np.array(
+            pair_indices[start : start + batch_size], dtype=np.int64
+        )
+        # Pair `i` is from node `i // (N - 1)` to the `i % (N - 1)`th other
+        # node
+        from_indices = batch // (num_nodes - 1)
+        to_indices = batch % (num_nodes - 1)
+        to_indices += to_indices >= from_indices
+        yield from_indices, to_indices
+
+
+def __search_batch(
+    from_indices: np.ndarray,
+    to_indices: np.ndarray,
+    graph: Graph,
+    distance: Distance,
+    args: TestArgs,
+    malicious: Optional[np.ndarray],
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    assert (
+        malicious is None or args.search_name == "graph-search"
+    ), "Only graph-search searches model malicious nodes"
+    if args.search_name == "best-first":
+        reachable = __reachability(graph)
+        num_requests = np.array(
+            [
+                __search(from_index, to_index, graph, distance, reachable) or 0
+                for from_index, to_index in zip(
+                    from_indices.tolist(), to_indices.tolist()
+                )
+            ],
+            dtype=np.int64,
+        )
+        return num_requests, None
+    elif args.search_name == "greedy":
+        num_requests = __greedy_search_batched(
+            from_indices, to_indices, graph, distance
+        )
+        return num_requests, None
+    elif args.search_name == "graph-search":
+        graph_search = GraphSearch(
+            graph,
+            distance,
+            args.search_breadth,
+            (
+                Adversary.get(args.adversary_name, distance)
+                if malicious is not None
+                else None
+            ),
+            malicious,
+            args.max_num_search_threads,
+            (
+                Latency.get(args.latency_name)
+                if args.latency_name is not None
+                else None
+            ),
+            args.search_timeout_sec,
+        )
+        search_results = [
+            graph_search.search(from_index, to_index) or SearchResult(0, 0)
+            for from_index, to_index in zip(
+                from_indices.tolist(), to_indices.tolist()
+            )
+        ]
+        num_requests = np.array(
+            [r.num_requests for r in search_results], dtype=np.int64
+        )
+        search_times_sec = (
+            np.array([r.time_sec for r in search_results])
+            if args.latency_name is not None
+            else None
+        )
+        return num_requests, search_times_sec
+    else:
+        raise AssertionError(f"Unknown search: {args.search_name}")
+
+
+def __reachability(graph: Graph) -> Callable[[int, int], bool]:
+    """
+    Gets a function that checks whether there is a path from one node of
+    `graph` to another. The strongly connected components of `graph` are only
+    found the first time that the function is called.
+    """
+    adjacency = None
+    components = None
+
+    def reachable(from_index: int, to_index: int) -> bool:
+        nonlocal adjacency, components
+        if adjacency is None:
+            rows, columns = np.nonzero(graph.neighbours != NO_NEIGHBOUR)
+            adjacency = scipy.sparse.csr_matrix(
+                (
+                    np.ones(len(rows), dtype=bool),
+                    (rows, graph.neighbours[rows, columns]),
+                ),
+                shape=(len(graph), len(graph)),
+            )
+            _, components = scipy.sparse.csgraph.connected_components(
+                adjacency, directed=True, connection="strong"
+            )
+        if components[from_index] == components[to_index]:
+            return True
+        reached = scipy.sparse.csgraph.breadth_first_order(
+            adjacency, from_index, directed=True, return_predecessors=False
+        )
+        return bool(np.any(reached == to_index))
+
+    return reachable
 
 
 def __search(
-    from_node: Node,
-    to_node: Node,
-    all_nodes: FrozenSet[Node],
+    from_index: int,
+    to_index: int,
+    graph: Graph,
     distance: Distance,
+    reachable: Callable[[int, int], bool],
 ) -> Optional[int]:
-    explored: Set[Node] = set()
-    to_explore: Set[Node] = {from_node}
-    while to_explore:
-        exploring = min(
-            to_explore,
-            key=lambda n: distance.distance(to_node.key_space, n.key_space),
+    """
+    Greedy best-first search from `from_index` to `to_index`, returning the
+    number of nodes explored, or `None` if the search failed.
+
+    The search only fails once it has explored every node that it can reach,
+    so long searches stop early if `reachable` finds that there's no path to
+    `to_index`.
+    """
+    to_position = graph.positions[to_index]
+    # Nodes that have been explored or are waiting to be explored
+    found: Set[int] = {from_index}
+    # Heap of nodes to explore, ordered by their distance to `to_index`
+    to_explore: List[Tuple[float, int]] = [
+        (
+            float(
+                distance.distances(to_position, graph.positions[from_index])
+            ),
+            from_index,
         )
-        to_explore.remove(exploring)
-        explored.add(exploring)
+    ]
+    num_explored = 0
+    while to_explore:
+        _, exploring = heapq.heappop(to_explore)
+        num_explored += 1
+        count("nodes_visited")
+        count("heap_operations")
 
-        if to_node.index in exploring.neighbours:
-            return len(explored)
-        new_nodes = frozenset(
-            n for n in all_nodes if n.index in exploring.neighbours
+        neighbours = graph.neighbours_of(exploring)
+        if to_index in neighbours:
+            return num_explored
+        if num_explored == REACHABILITY_CHECK_NUM_EXPLORED and not reachable(
+            from_index, to_index
+        ):
+            return None
+        new_neighbours = [n for n in neighbours.tolist() if n not in found]
+        if not new_neighbours:
+            continue
+        found.update(new_neighbours)
+        new_distances = distance.distances(
+            to_position, graph.positions[new_neighbours]
         )
-        to_explore.update(new_nodes.difference(explored))
+        count("distance_evaluations", len(new_neighbours))
+        count("heap_operations", len(new_neighbours))
+        for new_distance, new_neighbour in zip(
+            new_distances.tolist(), new_neighbours
+        ):
+            heapq.heappush(to_explore, (new_distance, new_neighbour))
     return None
+
+
+def __greedy_search_batched(
+    from_indices: np.ndarray,
+    to_indices: np.ndarray,
+    graph: Graph,
+    distance: Distance,
+) -> np.ndarray:
+    """
+    Greedy searches from each of `from_indices` to each of `to_indices`, where
+    each search moves to the neighbour closest to its target until the target
+    is found, or until no neighbour is closer than the current node.
+
+    All searches are advanced in lockstep, one request at a time. Returns the
+    number of requests made by each search, or zero if it failed.
+    """
+    num_requests = np.zeros(len(from_indices), dtype=np.int64)
+    current = from_indices.copy()
+    current_distances = distance.distances(
+        graph.positions[to_indices], graph.positions[current]
+    )
+    # Indices of the searches still running
+    active = np.arange(len(from_indices))
+    while len(active) > 0:
+        num_requests[active] += 1
+        targets = to_indices[active]
+        neighbours = graph.neighbours[current[active]]
+        found = np.any(neighbours == targets[:, np.newaxis], axis=1)
+
+        neighbour_distances = distance.distances(
+            graph.positions[targets][:, np.newaxis, :],
+            graph.positions[neighbours],
+        )
+        neighbour_distances[neighbours == NO_NEIGHBOUR] = np.inf
+        count("nodes_visited", len(active))
+        count("distance_evaluations", neighbour_distances.size)
+        closest = np.argmin(neighbour_distances, axis=1)
+        closest_distances = neighbour_distances[
+            np.arange(len(active)), closest
+        ]
+        progressing = ~found & (closest_distances < current_distances[active])
+
+        num_requests[active[~found & ~progressing]] = 0
+        current[active[progressing]] = neighbours[
+            np.arange(len(active)), closest
+        ][progressing]
+        current_distances[active[progressing]] = closest_distances[progressing]
+        active = active[progressing]
+    return num_requests
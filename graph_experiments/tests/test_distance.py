@@ -0,0 +1,122 @@
+import unittest
+from typing import Sequence
+
+import numpy as np
+
+from graph_experiments import Distance, GraphArgs, KeySpace, constants
+
+NUM_POINTS = 50
+
+RTOL = 1e-6
+"""
+The relative tolerance when comparing distances. `Kipa` takes its root in
+single precision, which NumPy can round differently for arrays and scalars.
+"""
+
+
+def _wrapped_difference(a: float, b: float) -> float:
+    return min(
+        abs(a - b),
+        abs((a + constants.KEY_SPACE_WIDTH) - b),
+        abs((a - constants.KEY_SPACE_WIDTH) - b),
+    )
+
+
+def _to_symbol(position: float) -> int:
+    return int(
+        10
+        * (position - constants.KEY_SPACE_LOWER)
+        / (constants.KEY_SPACE_UPPER - constants.KEY_SPACE_LOWER)
+    )
+
+
+def _scalar_distance(
+    name: str, a: Sequence[float], b: Sequence[float]
+) -> float:
+    """
+    Calculates the distance between two points one dimension at a time, as
+    each `Distance` did before distances were batched.
+    """
+    if name == "wrapped":
+        return sum(_wrapped_difference(x, y) ** 2 for x, y in zip(a, b)) ** 0.5
+    elif name == "manhattan":
+        return sum(_wrapped_difference(x, y) for x, y in zip(a, b))
+    elif name == "unwrapped":
+        return sum((x - y) ** 2 for x, y in zip(a, b)) ** 0.5
+    elif name == "ring":
+        return abs(abs(a[0]) - _scalar_distance("wrapped", a[1:], b[1:]))
+    elif name == "lattice":
+        return float(sum(_to_symbol(x) != _to_symbol(y) for x, y in zip(a, b)))
+    elif name == "kipa":
+        total = sum(
+            min(abs(x - y), constants.KIPA_KEY_SPACE_WIDTH - abs(x - y))
+            for x, y in zip(a, b)
+        )
+        return total ** (1 / len(a))
+    else:
+        raise AssertionError(f"Unknown distance: {name}")
+
+
+class TestBatchedDistances(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+
+    def test_matches_scalar_distances(self):
+        for name in [
+            "wrapped",
+            "manhattan",
+            "unwrapped",
+            "ring",
+            "lattice",
+            "kipa",
+        ]:
+            for dimensions in [2, 3]:
+                with self.subTest(name=name, dimensions=dimensions):
+                    distance = Distance.get(
+                        name, GraphArgs(NUM_POINTS, dimensions, 5)
+                    )
+                    a = distance.random_positions(NUM_POINTS)
+                    b = distance.random_positions(NUM_POINTS)
+                    expected = np.array(
+                        [
+                            _scalar_distance(name, x.tolist(), y.tolist())
+                            for x, y in zip(a, b)
+                        ]
+                    )
+
+                    np.testing.assert_allclose(
+                        distance.distances(a, b), expected, rtol=RTOL
+                    )
+                    np.testing.assert_allclose(
+                        [
+                            distance.distance(KeySpace(x), KeySpace(y))
+                            for x, y in zip(a.tolist(), b.tolist())
+                        ],
+                        expected,
+                        rtol=RTOL,
+                    )
+
+    def test_broadcasts_point_against_array(self):
+        for name in ["wrapped", "manhattan", "unwrapped", "ring", "kipa"]:
+            with self.subTest(name=name):
+                distance = Distance.get(name, GraphArgs(NUM_POINTS, 3, 5))
+                positions = distance.random_positions(NUM_POINTS)
+
+                np.testing.assert_allclose(
+                    distance.distances(positions[0], positions),
+                    [distance.distances(positions[0], p) for p in positions],
+                    rtol=RTOL,
+                )
+
+    def test_pairwise_distances(self):
+        for name in ["wrapped", "manhattan", "unwrapped", "ring", "kipa"]:
+            with self.subTest(name=name):
+                distance = Distance.get(name, GraphArgs(NUM_POINTS, 3, 5))
+                a = distance.random_positions(NUM_POINTS)
+                b = distance.random_positions(NUM_POINTS // 2)
+
+                np.testing.assert_allclose(
+                    distance.pairwise_distances(a, b),
+                    [[distance.distances(x, y) for y in b] for x in a],
+                    rtol=RTOL,
+                )
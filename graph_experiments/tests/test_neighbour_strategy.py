@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+from graph_experiments import Distance, Graph, GraphArgs, NeighbourStrategy
+from graph_experiments.neighbour_strategy import Closest
+
+
+class TestClosest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+
+    def test_spatial_index_matches_brute_force(self):
+        for name in ["wrapped", "manhattan", "unwrapped", "kipa"]:
+            for dimensions in [2, 3]:
+                with self.subTest(name=name, dimensions=dimensions):
+                    args = GraphArgs(300, dimensions, 6)
+                    distance = Distance.get(name, args)
+                    strategy = Closest(distance, args)
+                    graph = Graph.random(args, distance)
+                    self.assertIsNotNone(
+                        distance.spatial_index(graph.positions)
+                    )
+
+                    indexed = strategy.apply_all(graph)
+                    brute_force = NeighbourStrategy.apply_all(strategy, graph)
+
+                    for index in range(len(graph)):
+                        # Compare the distances rather than the indices, in
+                        # case nodes are the same distance away
+                        np.testing.assert_allclose(
+                            np.sort(
+                                self.__distances(indexed, index, distance)
+                            ),
+                            np.sort(
+                                self.__distances(brute_force, index, distance)
+                            ),
+                        )
+
+    def test_spatial_index_with_few_nodes(self):
+        args = GraphArgs(4, 2, 6)
+        distance = Distance.get("wrapped", args)
+        graph = Graph.random(args, distance)
+
+        connected_graph = Closest(distance, args).apply_all(graph)
+
+        for index in range(len(graph)):
+            self.assertEqual(
+                set(connected_graph.neighbours_of(index).tolist()),
+                set(range(len(graph))) - {index},
+            )
+
+    @staticmethod
+    def __distances(
+        graph: Graph, index: int, distance: Distance
+    ) -> np.ndarray:
+        return distance.distances(
+            graph.positions[index],
+            graph.positions[graph.neighbours_of(index)],
+        )
@@ -0,0 +1,72 @@
+import unittest
+from typing import Optional, Set
+
+import numpy as np
+
+from graph_experiments import Distance, Graph, GraphArgs, KeySpace, tester
+from graph_experiments.neighbour_strategy import Closest
+
+search = getattr(tester, "__search")
+
+
+def _linear_search(
+    from_index: int, to_index: int, graph: Graph, distance: Distance
+) -> Optional[int]:
+    """
+    Best-first search that finds the closest node to explore by scanning every
+    node waiting to be explored, as the search did before it used a heap.
+    """
+    explored: Set[int] = set()
+    to_explore: Set[int] = {from_index}
+    while to_explore:
+        exploring = min(
+            to_explore,
+            key=lambda n: distance.distance(
+                KeySpace(graph.positions[to_index].tolist()),
+                KeySpace(graph.positions[n].tolist()),
+            ),
+        )
+        to_explore.remove(exploring)
+        explored.add(exploring)
+
+        neighbours = set(graph.neighbours_of(exploring).tolist())
+        if to_index in neighbours:
+            return len(explored)
+        to_explore.update(neighbours.difference(explored))
+    return None
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+
+    def test_matches_linear_search(self):
+        for name in ["wrapped", "manhattan", "unwrapped", "kipa"]:
+            with self.subTest(name=name):
+                args = GraphArgs(200, 2, 3)
+                distance = Distance.get(name, args)
+                graph = Closest(distance, args).apply_all(
+                    Graph.random(args, distance)
+                )
+
+                num_failed = 0
+                for from_index, to_index in np.random.randint(
+                    len(graph), size=(100, 2)
+                ).tolist():
+                    expected = _linear_search(
+                        from_index, to_index, graph, distance
+                    )
+                    num_failed += expected is None
+                    self.assertEqual(
+                        search(
+                            from_index,
+                            to_index,
+                            graph,
+                            distance,
+                            lambda _from, _to: True,
+                        ),
+                        expected,
+                    )
+                # Closest graphs with few neighbours are rarely connected, so
+                # failed searches are compared too
+                self.assertGreater(num_failed, 0)
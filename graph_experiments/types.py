@@ -1,5 +1,5 @@
 import random
-from typing import NamedTuple, FrozenSet, Tuple
+from typing import NamedTuple, FrozenSet, Tuple, Optional
 
 from graph_experiments import constants
 
@@ -66,3 +66,43 @@ class StrategyArgs(NamedTuple):
 class TestArgs(NamedTuple):
     num_search_tests: int
     num_graph_tests: int
+    # Either "best-first", "greedy" or "graph-search"
+    search_name: str = "best-first"
+    # Whether to search between every pair of nodes, rather than a sample
+    all_pairs: bool = False
+    # If either is set, searches stop once the confidence interval of the
+    # success rate and/or the mean number of requests is no wider than this.
+    # `num_search_tests` is then the maximum number of searches.
+    success_interval_width: Optional[float] = None
+    mean_interval_width: Optional[float] = None
+    # Breadth of "graph-search" searches, matching `DEFAULT_SEARCH_BREADTH` in
+    # the daemon
+    search_breadth: int = 3
+    # Fraction of nodes that respond to "graph-search" searches using the
+    # adversary named `adversary_name`. Searches are only made between honest
+    # nodes.
+    malicious_fraction: float = 0
+    adversary_name: str = "black-hole"
+    # Number of queries that "graph-search" searches run at once, and how long
+    # queries take before timing out, matching `DEFAULT_MAX_NUM_SEARCH_THREADS`
+    # and `DEFAULT_SEARCH_TIMEOUT_SEC` in the daemon
+    max_num_search_threads: int = 3
+    search_timeout_sec: float = 5
+    # Distribution of the time each query takes, as given to `Latency.get`. If
+    # set, the time taken by "graph-search" searches is reported.
+    latency_name: Optional[str] = None
+
+
+class ChurnArgs(NamedTuple):
+    num_events: int
+    # Rate that new nodes arrive at, per second
+    arrival_rate: float
+    # Rate that each node departs at, per second
+    departure_rate: float
+    # Seconds between each node checking that its neighbours are alive, as in
+    # the daemon's `NeighbourGc`, or `None` to never remove dead neighbours
+    gc_period: Optional[float]
+    # Number of consecutive failed checks before a neighbour is removed
+    gc_num_retries: int
+    # Seconds between each measurement of the searches in the network
+    measure_period: float
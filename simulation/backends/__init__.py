@@ -1,3 +1,4 @@
 from .backend import Backend, CliCommandResult, CliCommand
-from .parallel_backend import ParallelBackend
+from .async_backend import AsyncBackend
 from .docker_backend import DockerBackend
+from .process_backend import ProcessBackend
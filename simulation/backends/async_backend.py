@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import List, Dict, AsyncIterator, Tuple
+
+from simulation.backends import Backend
+from simulation.backends.backend import CliCommand, CliCommandResult
+from simulation.networks import NodeId
+
+log = logging.getLogger(__name__)
+
+MAX_COMMANDS_PER_NODE = 10
+"""
+Matches `DEFAULT_SEARCH_THREAD_POOL_SIZE` in the daemon, as any more searches
+on a single node would queue behind each other.
+"""
+
+PROGRESS_INTERVAL_SEC = 10
+
+
+class AsyncBackend(Backend, ABC):
+    """
+    Runs commands concurrently on an event loop, rather than on a thread each.
+
+    At most `max_commands` commands run at once across the network, and at
+    most `max_commands_per_node` on each node.
+    """
+
+    def __init__(
+        self,
+        max_commands: int,
+        max_commands_per_node: int = MAX_COMMANDS_PER_NODE,
+    ):
+        self.max_commands = max_commands
+        self.max_commands_per_node = max_commands_per_node
+        self.loop = asyncio.new_event_loop()
+        # Before Python 3.8, subprocesses can only be run on the current event
+        # loop, as it's the loop that the child watcher is attached to
+        asyncio.set_event_loop(self.loop)
+
+    def run_commands(
+        self, commands: List[CliCommand]
+    ) -> List[CliCommandResult]:
+        return self.loop.run_until_complete(self.__gather(commands))
+
+    async def stream_commands(
+        self, commands: List[CliCommand]
+    ) -> AsyncIterator[CliCommandResult]:
+        """
+        Runs `commands`, yielding the result of each command as soon as it
+        finishes, in the order they finish.
+        """
+        async for _, result in self.__stream(commands):
+            yield result
+
+    @abstractmethod
+    async def run_command_async(self, command: CliCommand) -> CliCommandResult:
+        pass
+
+    async def __gather(
+        self, commands: List[CliCommand]
+    ) -> List[CliCommandResult]:
+        results: List[CliCommandResult] = [None] * len(commands)
+        async for index, result in self.__stream(commands):
+            results[index] = result
+        return results
+
+    async def __stream(
+        self, commands: List[CliCommand]
+    ) -> AsyncIterator[Tuple[int, CliCommandResult]]:
+        semaphore = asyncio.Semaphore(self.max_commands)
+        node_semaphores: Dict[NodeId, asyncio.Semaphore] = {}
+
+        async def run(
+            index: int, command: CliCommand
+        ) -> Tuple[int, CliCommandResult]:
+            if command.node_id not in node_semaphores:
+                node_semaphores[command.node_id] = asyncio.Semaphore(
+                    self.max_commands_per_node
+                )
+            async with node_semaphores[command.node_id], semaphore:
+                log.debug("Running command: %s", command)
+                return index, await self.run_command_async(command)
+
+        futures = [
+            asyncio.ensure_future(run(index, command), loop=self.loop)
+            for index, command in enumerate(commands)
+        ]
+        start_sec = time.time()
+        last_progress_sec = start_sec
+        num_successful = 0
+        try:
+            for num_finished, future in enumerate(
+                asyncio.as_completed(futures), start=1
+            ):
+                index, result = await future
+                num_successful += result.successful()
+                if time.time() - last_progress_sec > PROGRESS_INTERVAL_SEC:
+                    last_progress_sec = time.time()
+                    log.info(
+                        "Finished running %d/%d commands, %d successful, "
+                        "%.1f commands/sec",
+                        num_finished,
+                        len(commands),
+                        num_successful,
+                        num_finished / (last_progress_sec - start_sec),
+                    )
+                yield index, result
+        finally:
+            for future in futures:
+                future.cancel()
+
+        log.info(
+            "Finished running %d commands, %d successful, %f seconds",
+            len(commands),
+            num_successful,
+            time.time() - start_sec,
+        )
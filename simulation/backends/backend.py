@@ -4,6 +4,25 @@ from typing import List, Dict, Optional, NamedTuple
 from simulation import Build
 from simulation.networks import Network, NodeId
 
+STARTUP_CONCURRENCY = 8
+"""The default number of daemons started at once."""
+
+STARTUP_MEMORY_BYTES = 256 * 1024 * 1024
+"""
+An estimate of the memory used by a daemon while starting up, when GPG reads
+keys. Daemons are only started while the host has this much available memory
+for each daemon starting.
+"""
+
+READY_LOG_MESSAGES = [
+    b"Started listening for TCP connections",
+    b"Started listening on unix socket",
+]
+"""Messages logged by the daemon once it has started both of its servers."""
+
+READY_TIMEOUT_SEC = 60
+POLL_INTERVAL_SEC = 0.5
+
 
 class Backend(ABC):
     @abstractmethod
@@ -12,6 +31,15 @@ class Backend(ABC):
     ) -> None:
         pass
 
+    def reset_network(self, network: Network) -> bool:
+        """
+        Restarts the nodes of the initialized network with the settings in
+        `network`, so that the network can be reused without recreating it.
+        Returns `False` if the network can't be reset to `network`, e.g.
+        because it has different nodes.
+        """
+        return False
+
     @abstractmethod
     def get_ip_address(self, node_id: NodeId) -> str:
         pass
@@ -60,3 +88,29 @@ class CliCommandResult(NamedTuple):
 
     def successful(self) -> bool:
         return self.stdout is not None
+
+
+def has_startup_memory(num_starting: int) -> bool:
+    """
+    Whether there's enough available memory to start another daemon while
+    `num_starting` daemons are starting.
+    """
+    if num_starting == 0:
+        # Always allow one daemon to start, so that startup can't stall
+        return True
+    available_bytes = __get_available_memory_bytes()
+    if available_bytes is None:
+        return True
+    return available_bytes >= STARTUP_MEMORY_BYTES * (num_starting + 1)
+
+
+def __get_available_memory_bytes() -> Optional[int]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Not on Linux, so don't limit startup by memory
+    return None
@@ -1,17 +1,26 @@
+import hashlib
 import json
 import logging
-import shutil
-import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Set, Iterator
 
 import docker
 from docker.models.containers import Container
 
 from simulation import Build
 from simulation.backends import CliCommand, CliCommandResult
-from simulation.backends import ParallelBackend
+from simulation.backends import AsyncBackend
+from simulation.backends.backend import (
+    STARTUP_CONCURRENCY,
+    READY_LOG_MESSAGES,
+    READY_TIMEOUT_SEC,
+    POLL_INTERVAL_SEC,
+    has_startup_memory,
+)
 from simulation.key_creator import GPG_HOME
 from simulation.networks import Network, Node, NodeId, ConnectionQuality
 
@@ -24,11 +33,29 @@ IPV4_PREFIX = "172.16"
 IPV6_PREFIX = "fd92:bd99:d235:d1c5::"
 
 
-class DockerBackend(ParallelBackend):
-    def __init__(self, num_threads: int):
-        super().__init__(num_threads)
+class DockerBackend(AsyncBackend):
+    """
+    Runs each node's daemon in its own Docker container, on a shared Docker network.
+
+    The Docker SDK's calls block, so CLI commands are run on a thread each, from a pool of
+    `max_commands` threads.
+    """
+
+    def __init__(self, max_commands: int, startup_concurrency: int = STARTUP_CONCURRENCY):
+        super().__init__(max_commands)
+        self.__command_executor = ThreadPoolExecutor(max_workers=max_commands)
+        self.__startup_concurrency = startup_concurrency
         self.__containers: Dict[NodeId, Container] = {}
         self.__ip_addresses: Dict[NodeId, str] = {}
+        # Guards admitting containers to start, and the number of containers starting
+        self.__startup_condition = threading.Condition()
+        self.__num_starting = 0
+        # The nodes the containers were created for, used to check if they can be reset
+        self.__nodes: Dict[NodeId, Node] = {}
+        self.__ipv6 = False
+        self.__disconnected: Set[NodeId] = set()
+        # Where each container's logs from its latest start begin
+        self.__log_offsets: Dict[NodeId, int] = {}
 
         self.__client = docker.from_env()
         self.__api_client = docker.APIClient()
@@ -41,24 +68,55 @@ class DockerBackend(ParallelBackend):
         builds = set(node_builds.values())
         build_to_image = {build: self.__create_docker_image(build) for build in builds}
 
-        log.info(f"Creating {len(network.nodes)} containers")
+        log.info(f"Creating {len(network.nodes)} containers, {self.__startup_concurrency} at a time")
         self.__containers = {}
         self.__ip_addresses = {}
-        for node in network.nodes:
-            image = build_to_image[node_builds[node.id]]
-            container, ip_address = self.__create_container(node, image, network)
+        self.__nodes = {node.id: node for node in network.nodes}
+        self.__ipv6 = network.ipv6
+        self.__disconnected = set()
+        self.__log_offsets = {}
+
+        def start(node: Node) -> Tuple[Container, str]:
+            return self.__start_container(node, build_to_image[node_builds[node.id]], network)
+
+        with ThreadPoolExecutor(max_workers=self.__startup_concurrency) as executor:
+            started = list(executor.map(start, network.nodes))
+        for node, (container, ip_address) in zip(network.nodes, started):
             self.__containers[node.id] = container
             self.__ip_addresses[node.id] = ip_address
-            # FIXME: If we don't sleep, we run out of memory when GPG reads keys, causing daemon
-            # startups to fail.
-            time.sleep(1)
 
         self.__fake_poor_connection(network.connection_quality)
 
+    def reset_network(self, network: Network) -> bool:
+        if not self.__can_reset(network):
+            return False
+
+        log.info(
+            f"Restarting {len(network.nodes)} daemons, {self.__startup_concurrency} at a time"
+        )
+
+        def restart(node: Node) -> str:
+            return self.__restart_container(node)
+
+        with ThreadPoolExecutor(max_workers=self.__startup_concurrency) as executor:
+            ip_addresses = list(executor.map(restart, network.nodes))
+        for node, ip_address in zip(network.nodes, ip_addresses):
+            self.__ip_addresses[node.id] = ip_address
+            self.__nodes[node.id] = node
+        self.__disconnected = set()
+
+        self.__fake_poor_connection(network.connection_quality, reset=True)
+        return True
+
     def get_ip_address(self, node_id: NodeId) -> str:
         return self.__ip_addresses[node_id]
 
-    def run_command(self, command: CliCommand) -> CliCommandResult:
+    async def run_command_async(self, command: CliCommand) -> CliCommandResult:
+        return await self.loop.run_in_executor(
+            self.__command_executor, self.__run_command, command
+        )
+
+    def __run_command(self, command: CliCommand) -> CliCommandResult:
         start_sec = time.time()
         output = self.__run_container_command(command.node_id, ["/root/kipa_cli", *command.args])
         duration_sec = time.time() - start_sec
@@ -70,6 +128,7 @@ class DockerBackend(ParallelBackend):
 
     def stop_networking(self, node_id: NodeId):
         self.__network.disconnect(self.__containers[node_id])
+        self.__disconnected.add(node_id)
 
     def get_logs(self, node_id: NodeId) -> List[dict]:
         return self.__get_logs_from_file(node_id, "/root/logs/log-daemon.json")
@@ -78,9 +137,9 @@ class DockerBackend(ParallelBackend):
         return self.__get_logs_from_file(node_id, "/root/logs/log-cli.json")
 
     def get_human_readable_logs(self, node_id: NodeId) -> bytes:
-        logs = self.__containers[node_id].attach(stdout=True, stderr=True, stream=False, logs=True)
+        logs = self.__containers[node_id].logs(stdout=True, stderr=True)
         assert isinstance(logs, bytes), f"Logs returned from docker was not bytes: {logs}"
-        return logs
+        return logs[self.__log_offsets.get(node_id, 0) :]
 
     def clean(self) -> None:
         log.info("Deleting old docker containers")
@@ -117,59 +176,169 @@ class DockerBackend(ParallelBackend):
         )
 
     def __create_docker_image(self, build: Build) -> str:
-        docker_directory = Path(tempfile.mkdtemp(suffix=build.id()))
-        log.debug(f"Made docker directory at {docker_directory}")
-
-        # TODO: Docker requires COPY files to be in the docker directory,
-        # meaning we copy the builds twice.
-        shutil.copy(str(build.cli_path), str(docker_directory / "kipa_cli"))
-        shutil.copy(str(build.daemon_path), str(docker_directory / "kipa_daemon"))
-
+        dockerfile = self.__create_dockerfile()
+        # Images are kept between simulations, and are named after what they're built from so that
+        # unchanged images are reused
+        image_key = hashlib.sha256(f"{build.id()}\n{dockerfile}".encode()).hexdigest()[:16]
+        image_name = f"{IMAGE_PREFIX}_{image_key}"
+        try:
+            self.__client.images.get(image_name)
+            log.info(f"Using existing KIPA image {image_name}")
+            return image_name
+        except docker.errors.ImageNotFound:
+            pass
+
+        # The build's directory only contains its binaries, so it's used as the docker directory
+        # rather than copying the binaries again
+        docker_directory = build.daemon_path.parent
+        assert build.cli_path.parent == docker_directory
         log.debug("Creating Dockerfile")
         with open(docker_directory / "Dockerfile", "w") as f:
-            # TODO: Base docker image has to use the same `glibc` as host
-            # machine
-            f.write(
-                f"""
-                FROM debian:buster-slim
-                ENV KIPA_KEY_ID ""
-                ENV KIPA_ARGS ""
-                RUN \\
-                    apt-get update && apt-get --yes install gpg iproute2
-                COPY kipa_daemon /root/kipa_daemon
-                COPY kipa_cli /root/kipa_cli
-                WORKDIR /root
-                RUN \\
-                    chmod +x kipa_daemon && \\
-                    chmod +x kipa_cli && \\
-                    echo "p@ssword" >> secret.txt
-                CMD RUST_BACKTRACE=1 ./kipa_daemon \\
-                    -vvvv \\
-                    --key-id $KIPA_KEY_ID \\
-                    $KIPA_ARGS
-            """
-            )
+            f.write(dockerfile)
 
-        image_name = f"{IMAGE_PREFIX}_{build.id()}"
         log.info(f"Building KIPA image {image_name} (may take a while)")
         self.__client.images.build(path=str(docker_directory), tag=image_name, quiet=False)
 
-        log.info(f"Removing docker directory at {docker_directory}")
-        shutil.rmtree(docker_directory)
-
         return image_name
 
+    @staticmethod
+    def __create_dockerfile() -> str:
+        # TODO: Base docker image has to use the same `glibc` as host machine
+        # The daemon runs in a loop so that it can be restarted without restarting the container,
+        # by creating `restart_daemon` and killing it. Otherwise the container exits with the
+        # daemon. The arguments are read from `daemon_args` on each start, in preference to
+        # `KIPA_ARGS`, which can't be changed after the container is created.
+        return """
+            FROM debian:buster-slim
+            ENV KIPA_KEY_ID ""
+            ENV KIPA_ARGS ""
+            RUN \\
+                apt-get update && apt-get --yes install gpg iproute2
+            COPY kipa_daemon /root/kipa_daemon
+            COPY kipa_cli /root/kipa_cli
+            WORKDIR /root
+            RUN \\
+                chmod +x kipa_daemon && \\
+                chmod +x kipa_cli && \\
+                echo "p@ssword" >> secret.txt
+            CMD while true; do \\
+                    RUST_BACKTRACE=1 ./kipa_daemon \\
+                        -vvvv \\
+                        --key-id $KIPA_KEY_ID \\
+                        $(cat daemon_args 2>/dev/null || echo $KIPA_ARGS) & \\
+                    echo $! > daemon.pid; \\
+                    wait $!; \\
+                    status=$?; \\
+                    [ -e restart_daemon ] || exit $status; \\
+                    rm restart_daemon; \\
+                done
+        """
+
+    def __start_container(
+        self, node: Node, image_name: str, network: Network
+    ) -> Tuple[Container, str]:
+        """
+        Creates a container once there's enough memory for it, and waits for its daemon to start.
+        """
+        with self.__admit_startup():
+            container, ip_address = self.__create_container(node, image_name, network)
+            self.__wait_until_ready(container, 0)
+        return container, ip_address
+
+    def __can_reset(self, network: Network) -> bool:
+        if network.ipv6 != self.__ipv6 or set(network.ids()) != set(self.__nodes):
+            return False
+        # Nodes with different builds need different images
+        return all(
+            (n.additional_features, n.clear_default_features, n.debug)
+            == (o.additional_features, o.clear_default_features, o.debug)
+            for n, o in ((n, self.__nodes[n.id]) for n in network.nodes)
+        )
+
+    def __restart_container(self, node: Node) -> str:
+        """
+        Restarts the daemon in a node's container with the node's arguments, so that it starts
+        from a fresh state without recreating or restarting the container. The daemon's JSON logs
+        are removed, as they would be in a new container.
+        """
+        container = self.__containers[node.id]
+        if node.id in self.__disconnected:
+            self.__network.connect(container)
+
+        # Passed as an argument rather than in the script, so that the arguments aren't
+        # interpreted by the shell
+        daemon_args = self.__format_daemon_args(node)
+        container.exec_run(
+            ["sh", "-c", 'printf %s "$1" > /root/daemon_args', "sh", daemon_args]
+        )
+
+        with self.__admit_startup():
+            log_offset = len(container.logs(stdout=True, stderr=True))
+            self.__log_offsets[node.id] = log_offset
+            container.reload()
+            if container.status == "running":
+                container.exec_run(
+                    [
+                        "sh",
+                        "-c",
+                        "touch /root/restart_daemon && rm -rf /root/logs "
+                        "&& kill $(cat /root/daemon.pid)",
+                    ]
+                )
+            else:
+                # The daemon exited, which stops the container
+                container.start()
+            self.__wait_until_ready(container, log_offset)
+        return self.__get_container_ip_address(container, self.__ipv6)
+
+    @contextmanager
+    def __admit_startup(self) -> Iterator[None]:
+        """
+        Waits until there's enough memory to start a daemon, and counts it as starting until the
+        context exits.
+        """
+        # Many daemons reading keys with GPG at once run out of memory, causing their startups to
+        # fail, so only start daemons while there's memory for them
+        with self.__startup_condition:
+            while not has_startup_memory(self.__num_starting):
+                self.__startup_condition.wait(timeout=POLL_INTERVAL_SEC)
+            self.__num_starting += 1
+
+        try:
+            yield
+        finally:
+            with self.__startup_condition:
+                self.__num_starting -= 1
+                self.__startup_condition.notify_all()
+
+    @staticmethod
+    def __wait_until_ready(container: Container, log_offset: int) -> None:
+        """
+        Waits for the daemon in `container` to start both of its servers, looking at logs after
+        `log_offset`.
+        """
+        start_sec = time.time()
+        while time.time() - start_sec < READY_TIMEOUT_SEC:
+            logs = container.logs(stdout=True, stderr=True)[log_offset:]
+            if all(message in logs for message in READY_LOG_MESSAGES):
+                log.debug(
+                    f"Container {container.name} ready after {time.time() - start_sec:.1f} seconds"
+                )
+                return
+            container.reload()
+            if container.status == "exited":
+                log.error(f"Container {container.name} exited on startup, logs: {logs.decode()}")
+                return
+            time.sleep(POLL_INTERVAL_SEC)
+        # `ensure_all_alive` retries nodes that aren't ready yet, so carry on
+        log.warning(f"Container {container.name} not ready after {READY_TIMEOUT_SEC} seconds")
+
     def __create_container(
         self, node: Node, image_name: str, network: Network
     ) -> Tuple[Container, str]:
         container_name = f"{DOCKER_PREFIX}_{node.id}"
 
-        daemon_args = {
-            k: (str(v) if type(v) != bool else str(v).lower()) for k, v in node.daemon_args.items()
-        }
-        daemon_args = {k.replace("_", "-"): v for k, v in daemon_args.items()}
-        daemon_args = [f"--{k} {v}" for k, v in daemon_args.items()]
-        daemon_args = " ".join(daemon_args)
+        daemon_args = self.__format_daemon_args(node)
         log.debug(f"Daemon args: {daemon_args}")
 
         log.info(f"Creating container with name {container_name}")
@@ -187,16 +356,28 @@ class DockerBackend(ParallelBackend):
             environment={"KIPA_KEY_ID": node.key_id(), "KIPA_ARGS": daemon_args},
         )
 
+        ip_address = self.__get_container_ip_address(container, network.ipv6)
+        log.debug(f"Created container with IP address {ip_address}")
+
+        return container, ip_address
+
+    def __get_container_ip_address(self, container: Container, ipv6: bool) -> str:
         network_details = self.__api_client.inspect_container(container.name)["NetworkSettings"][
             "Networks"
         ][self.__network.name]
-        if not network.ipv6:
-            ip_address = f"{network_details['IPAddress']}:10842"
+        if not ipv6:
+            return f"{network_details['IPAddress']}:10842"
         else:
-            ip_address = f"[{network_details['GlobalIPv6Address']}]:10842"
-        log.debug(f"Created container with IP address {ip_address}")
+            return f"[{network_details['GlobalIPv6Address']}]:10842"
 
-        return container, ip_address
+    @staticmethod
+    def __format_daemon_args(node: Node) -> str:
+        daemon_args = {
+            k: (str(v) if type(v) != bool else str(v).lower()) for k, v in node.daemon_args.items()
+        }
+        daemon_args = {k.replace("_", "-"): v for k, v in daemon_args.items()}
+        daemon_args = [f"--{k} {v}" for k, v in daemon_args.items()]
+        return " ".join(daemon_args)
 
     def __run_container_command(self, node_id: NodeId, command: List[str]) -> Optional[str]:
         try:
@@ -234,8 +415,15 @@ class DockerBackend(ParallelBackend):
             logs.append(json_dict)
         return logs
 
-    def __fake_poor_connection(self, quality: Optional[ConnectionQuality]) -> None:
+    def __fake_poor_connection(
+        self, quality: Optional[ConnectionQuality], reset: bool = False
+    ) -> None:
         if quality is None:
+            if reset:
+                # Remove any connection faked for a previous network. This fails harmlessly if
+                # there wasn't one
+                for container in self.__containers.values():
+                    container.exec_run(["tc", "qdisc", "del", "dev", "eth0", "root"])
             return
 
         log.debug(
@@ -246,7 +434,8 @@ class DockerBackend(ParallelBackend):
         )
 
         command = (
-            f"tc qdisc add dev eth0 root netem "
+            # `replace` rather than `add`, so that a reset network's connection is changed in place
+            f"tc qdisc replace dev eth0 root netem "
             + (f"loss {quality.loss * 100}% " if quality.loss != 0 else "")
             + (f"delay {quality.delay} " if quality.delay != 0 else "")
             + (f"rate {quality.rate}kbit" if quality.rate != 0 else "")
@@ -0,0 +1,391 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import time
+from pathlib import Path
+from typing import List, Dict, Optional
+
+from simulation import Build
+from simulation.backends import CliCommand, CliCommandResult
+from simulation.backends import AsyncBackend
+from simulation.backends.backend import (
+    STARTUP_CONCURRENCY,
+    READY_LOG_MESSAGES,
+    READY_TIMEOUT_SEC,
+    POLL_INTERVAL_SEC,
+    has_startup_memory,
+)
+from simulation.key_creator import GPG_HOME
+from simulation.networks import Network, Node, NodeId
+
+log = logging.getLogger(__name__)
+
+PROCESS_DIRECTORY = Path("/tmp/kipa_simulation")
+"""
+Each node gets a working directory in here. This is kept short, as it contains
+each node's unix socket, and socket paths are limited to 108 characters.
+"""
+
+FIRST_PORT = 10842
+"""Matches `DEFAULT_PORT` in the daemon. Each node listens on the next port."""
+
+PID_FILE_NAME = "daemon.pid"
+"""
+Written to each node's working directory, so that daemons left running by a
+simulation that didn't clean up can be found and stopped.
+"""
+
+LOOPBACK_INTERFACE = "lo"
+SECRET = "p@ssword"
+COMMAND_TIMEOUT_SEC = 60
+STOP_TIMEOUT_SEC = 10
+
+
+class ProcessBackend(AsyncBackend):
+    """
+    Runs each node's daemon as a local process, rather than in a Docker
+    container, so that large networks can start in seconds.
+
+    Every daemon listens on all addresses, so nodes are told apart by port, and
+    advertise the loopback address. Each node has its own working directory,
+    containing its secret, unix socket, and logs. Each CLI command writes its
+    logs to its own directory, so that commands can run concurrently on the
+    same node.
+
+    Daemons are started `startup_concurrency` at a time, as long as the host
+    has enough available memory for them, and each start waits until the
+    daemon is listening.
+    """
+
+    def __init__(
+        self, max_commands: int, startup_concurrency: int = STARTUP_CONCURRENCY
+    ):
+        super().__init__(max_commands)
+        self.__startup_concurrency = startup_concurrency
+        self.__num_starting = 0
+        self.__processes: Dict[NodeId, subprocess.Popen] = {}
+        self.__ip_addresses: Dict[NodeId, str] = {}
+        self.__builds: Dict[NodeId, Build] = {}
+        self.__stopped: Dict[NodeId, bool] = {}
+        self.__command_numbers = itertools.count()
+
+    def initialize_network(
+        self, network: Network, node_builds: Dict[NodeId, Build]
+    ) -> None:
+        if network.connection_quality is not None:
+            raise ValueError(
+                "Faking poor connections isn't supported by `ProcessBackend`"
+            )
+
+        log.info(
+            f"Starting {len(network.nodes)} daemon processes, "
+            f"{self.__startup_concurrency} at a time"
+        )
+        PROCESS_DIRECTORY.mkdir(parents=True, exist_ok=True)
+        self.__processes = {}
+        self.__ip_addresses = {}
+        self.__builds = dict(node_builds)
+        self.__stopped = {}
+        self.loop.run_until_complete(
+            self.__start_processes(network, node_builds)
+        )
+        for index, node in enumerate(network.nodes):
+            port = FIRST_PORT + index
+            if not network.ipv6:
+                self.__ip_addresses[node.id] = f"127.0.0.1:{port}"
+            else:
+                self.__ip_addresses[node.id] = f"[::1]:{port}"
+            self.__stopped[node.id] = False
+
+    def get_ip_address(self, node_id: NodeId) -> str:
+        return self.__ip_addresses[node_id]
+
+    async def run_command_async(self, command: CliCommand) -> CliCommandResult:
+        if self.__stopped[command.node_id]:
+            # With Docker, the local socket of a disconnected node still
+            # works, so resume the node to talk to it. Commands are only run on
+            # disconnected nodes after testing, when getting logs.
+            log.debug(f"Resuming stopped node {command.node_id}")
+            self.__processes[command.node_id].send_signal(signal.SIGCONT)
+            self.__stopped[command.node_id] = False
+
+        log_directory = (
+            self.__directory(command.node_id)
+            / "cli_logs"
+            / str(next(self.__command_numbers))
+        )
+        start_sec = time.time()
+        output = await self.__run_cli(
+            command.node_id, command.args, log_directory
+        )
+        duration_sec = time.time() - start_sec
+        if output is None:
+            return CliCommandResult.failed(command)
+
+        return CliCommandResult(
+            command,
+            output,
+            self.__get_logs_from_file(log_directory / "log-cli.json"),
+            duration_sec,
+        )
+
+    def stop_networking(self, node_id: NodeId):
+        # Without network namespaces a single process's networking can't be
+        # cut off, so the whole process is paused instead
+        self.__processes[node_id].send_signal(signal.SIGSTOP)
+        self.__stopped[node_id] = True
+
+    def get_logs(self, node_id: NodeId) -> List[dict]:
+        return self.__get_logs_from_file(
+            self.__directory(node_id) / "logs" / "log-daemon.json"
+        )
+
+    def get_cli_logs(self, node_id: NodeId) -> List[dict]:
+        cli_logs_directory = self.__directory(node_id) / "cli_logs"
+        if not cli_logs_directory.is_dir():
+            return []
+        log_directories = sorted(
+            cli_logs_directory.iterdir(),
+            key=lambda path: int(path.name),
+        )
+        return [
+            cli_log
+            for log_directory in log_directories
+            for cli_log in self.__get_logs_from_file(
+                log_directory / "log-cli.json"
+            )
+        ]
+
+    def get_human_readable_logs(self, node_id: NodeId) -> bytes:
+        with open(str(self.__directory(node_id) / "daemon.log"), "rb") as f:
+            return f.read()
+
+    def clean(self) -> None:
+        log.info("Stopping daemon processes")
+        for node_id, process in self.__processes.items():
+            if self.__stopped[node_id]:
+                process.send_signal(signal.SIGCONT)
+            process.terminate()
+        for node_id, process in self.__processes.items():
+            try:
+                process.wait(timeout=STOP_TIMEOUT_SEC)
+            except subprocess.TimeoutExpired:
+                log.warning(f"Killing daemon process for {node_id}")
+                process.kill()
+                process.wait()
+        self.__processes = {}
+        self.__stopped = {}
+
+        if PROCESS_DIRECTORY.is_dir():
+            self.__kill_stale_processes()
+            log.debug(f"Removing process directory {PROCESS_DIRECTORY}")
+            shutil.rmtree(str(PROCESS_DIRECTORY))
+
+    async def __start_processes(
+        self, network: Network, node_builds: Dict[NodeId, Build]
+    ) -> None:
+        semaphore = asyncio.Semaphore(self.__startup_concurrency)
+
+        async def start(index: int, node: Node) -> None:
+            async with semaphore:
+                # Many daemons reading keys with GPG at once run out of memory,
+                # causing their startups to fail, so only start daemons while
+                # there's memory for them
+                while not has_startup_memory(self.__num_starting):
+                    await asyncio.sleep(POLL_INTERVAL_SEC)
+                self.__num_starting += 1
+                try:
+                    process = self.__start_process(
+                        node,
+                        node_builds[node.id],
+                        FIRST_PORT + index,
+                        network.ipv6,
+                    )
+                    self.__processes[node.id] = process
+                    await self.__wait_until_ready(node.id, process)
+                finally:
+                    self.__num_starting -= 1
+
+        await asyncio.gather(
+            *(start(index, node) for index, node in enumerate(network.nodes))
+        )
+
+    async def __wait_until_ready(
+        self, node_id: NodeId, process: subprocess.Popen
+    ) -> None:
+        """
+        Waits for the daemon of `node_id` to start both of its servers.
+        """
+        log_path = self.__directory(node_id) / "daemon.log"
+        start_sec = time.time()
+        while time.time() - start_sec < READY_TIMEOUT_SEC:
+            with open(str(log_path), "rb") as f:
+                logs = f.read()
+            if all(message in logs for message in READY_LOG_MESSAGES):
+                log.debug(
+                    f"Daemon for {node_id} ready after "
+                    f"{time.time() - start_sec:.1f} seconds"
+                )
+                return
+            if process.poll() is not None:
+                log.error(
+                    f"Daemon for {node_id} exited on startup, "
+                    f"logs: {logs.decode()}"
+                )
+                return
+            await asyncio.sleep(POLL_INTERVAL_SEC)
+        # `ensure_all_alive` retries nodes that aren't ready yet, so carry on
+        log.warning(
+            f"Daemon for {node_id} not ready after {READY_TIMEOUT_SEC} seconds"
+        )
+
+    def __start_process(
+        self, node: Node, build: Build, port: int, ipv6: bool
+    ) -> subprocess.Popen:
+        directory = self.__directory(node.id)
+        directory.mkdir()
+        with open(str(directory / "secret.txt"), "w") as f:
+            f.write(SECRET)
+
+        daemon_args = {
+            k: (str(v) if type(v) != bool else str(v).lower())
+            for k, v in node.daemon_args.items()
+        }
+        daemon_args = [
+            arg
+            for k, v in daemon_args.items()
+            for arg in (f"--{k.replace('_', '-')}", v)
+        ]
+        log.debug(f"Daemon args: {daemon_args}")
+
+        log.info(f"Starting daemon for {node.id} on port {port}")
+        with open(str(directory / "daemon.log"), "wb") as daemon_log:
+            process = subprocess.Popen(
+                [
+                    str(build.daemon_path.absolute()),
+                    "-vvvv",
+                    "--key-id",
+                    node.key_id(),
+                    "--port",
+                    str(port),
+                    "--interface-name",
+                    LOOPBACK_INTERFACE,
+                    "--force-ipv6",
+                    str(ipv6).lower(),
+                    "--socket-path",
+                    str(directory / "kipa.sock"),
+                    *daemon_args,
+                ],
+                cwd=str(directory),
+                env=self.__environment(),
+                stdout=daemon_log,
+                stderr=subprocess.STDOUT,
+            )
+        with open(str(directory / PID_FILE_NAME), "w") as f:
+            f.write(str(process.pid))
+        return process
+
+    async def __run_cli(
+        self, node_id: NodeId, args: List[str], log_directory: Path
+    ) -> Optional[str]:
+        directory = self.__directory(node_id)
+        command = [
+            str(self.__builds[node_id].cli_path.absolute()),
+            "--socket-path",
+            str(directory / "kipa.sock"),
+            "--log-directory",
+            str(log_directory),
+            *args,
+        ]
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            cwd=str(directory),
+            env=self.__environment(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        try:
+            stdout, _ = await asyncio.wait_for(
+                process.communicate(), COMMAND_TIMEOUT_SEC
+            )
+        except asyncio.TimeoutError:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                # The command finished just as it timed out
+                pass
+            await process.wait()
+            log.error(
+                f"Timed out on {node_id} when performing command {command}"
+            )
+            return None
+
+        output = stdout.decode()
+        if process.returncode != 0:
+            log.error(
+                f"Bad return code when executing command: {command}. "
+                f"Output was: {output}"
+            )
+            return None
+
+        return output
+
+    @staticmethod
+    def __kill_stale_processes() -> None:
+        """
+        Kills daemons left running in `PROCESS_DIRECTORY` by a simulation that
+        didn't clean up, e.g. because it was killed, so that they don't keep
+        their ports and sockets.
+        """
+        for pid_path in PROCESS_DIRECTORY.glob(f"*/{PID_FILE_NAME}"):
+            pid = int(pid_path.read_text())
+            # The PID may have been reused by another process since
+            if not ProcessBackend.__is_daemon(pid):
+                continue
+            log.warning(f"Killing stale daemon process {pid}")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    @staticmethod
+    def __is_daemon(pid: int) -> bool:
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                executable = f.read().split(b"\0")[0]
+        except OSError:
+            # The process doesn't exist, or we're not on Linux and can't check
+            return False
+        return os.path.basename(executable) == b"kipa_daemon"
+
+    @staticmethod
+    def __directory(node_id: NodeId) -> Path:
+        return PROCESS_DIRECTORY / node_id.key_id
+
+    @staticmethod
+    def __environment() -> Dict[str, str]:
+        return {**os.environ, "GNUPGHOME": GPG_HOME, "RUST_BACKTRACE": "1"}
+
+    @staticmethod
+    def __get_logs_from_file(path: Path) -> List[Dict]:
+        if not path.is_file():
+            return []
+        logs: List[dict] = []
+        with open(str(path)) as f:
+            for line in f:
+                if line.strip() == "":
+                    continue
+                try:
+                    json_dict = json.loads(line)
+                except json.decoder.JSONDecodeError as e:
+                    log.warning(
+                        f"Failed to decode JSON string: {line}, error: {e}"
+                    )
+                    continue
+                logs.append(json_dict)
+        return logs
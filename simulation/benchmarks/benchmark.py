@@ -26,6 +26,12 @@ class Benchmark(ABC):
 
 
 class SuccessSpeedBenchmark(Benchmark, ABC):
+    reuse_backend = False
+    """
+    Whether every parameter changes only settings that a backend can reset in
+    place, so that one backend is started and reused for all parameters.
+    """
+
     def __init__(
         self,
         title: str,
@@ -39,13 +45,28 @@ class SuccessSpeedBenchmark(Benchmark, ABC):
 
     def create(self, network: Network):
         # Get results
-        results = [
-            simulator.simulate(
-                self.get_network(network, p),
-                self.output_directory / self.format_parameter(p),
+        # The backend is started with the first parameter, so it only needs
+        # resetting for the rest
+        backend = (
+            simulator.start_backend(
+                self.get_network(network, self.parameters[0])
             )
-            for p in self.parameters
-        ]
+            if self.reuse_backend
+            else None
+        )
+        try:
+            results = [
+                simulator.simulate(
+                    self.get_network(network, p),
+                    self.output_directory / self.format_parameter(p),
+                    backend,
+                    reset=index > 0,
+                )
+                for index, p in enumerate(self.parameters)
+            ]
+        finally:
+            if backend is not None:
+                backend.clean()
 
         # Create matplotlib figure
         figure = plt.figure()
@@ -10,6 +10,9 @@ DISCONNECT_PROBABILITIES = [x / 10 for x in range(10)]
 
 
 class ReliabilityBenchmark(SuccessSpeedBenchmark):
+    # Only which nodes are disconnected changes between parameters
+    reuse_backend = True
+
     def __init__(self, output_directory: Path):
         super().__init__(
             "reliability",
@@ -16,6 +16,9 @@ second delay, and 10kbps
 
 
 class SpeedBenchmark(SuccessSpeedBenchmark):
+    # Only connection quality and daemon arguments change between parameters
+    reuse_backend = True
+
     def __init__(self, output_directory: Path):
         super().__init__(
             "speed",
@@ -5,6 +5,8 @@ from typing import NamedTuple
 class Build(NamedTuple):
     cli_path: Path
     daemon_path: Path
+    # Identifies the source and arguments the build was made from
+    key: str
 
     def id(self) -> str:
-        return hex(hash(self))[-8:]
+        return self.key
@@ -1,2 +1,7 @@
 from simulation.networks.node import Node, NodeId
-from simulation.networks.network import Network, ConnectionQuality, ConnectType
+from simulation.networks.network import (
+    Network,
+    ConnectionQuality,
+    ConnectType,
+    BackendType,
+)
@@ -19,6 +19,9 @@ class Network(NamedTuple):
     connect_type: "ConnectType"
     connection_quality: Optional["ConnectionQuality"]
     num_threads: int
+    backend: "BackendType"
+    # The number of nodes started at once, or `None` for the backend's default
+    startup_concurrency: Optional[int]
 
     # TODO: Try to not use KeyCreator here
     @classmethod
@@ -43,6 +46,8 @@ class Network(NamedTuple):
             ConnectType.from_str(config.get("connect_type", "cyclical")),
             connection_quality,
             config.get("num_threads", multiprocessing.cpu_count()),
+            BackendType.from_str(config.get("backend", "docker")),
+            config.get("startup_concurrency"),
         )
 
     def ids(self) -> List[NodeId]:
@@ -80,6 +85,28 @@ class ConnectType(Enum):
             raise ValueError(f"Unhandled `ConnectType`: {self}")
 
 
+class BackendType(Enum):
+    DOCKER = 0
+    PROCESS = 1
+
+    @classmethod
+    def from_str(cls, s: str) -> "BackendType":
+        if s == "docker":
+            return BackendType.DOCKER
+        elif s == "process":
+            return BackendType.PROCESS
+        else:
+            raise ValueError(f"Unrecognized `BackendType`: {s}")
+
+    def to_str(self) -> str:
+        if self == BackendType.DOCKER:
+            return "docker"
+        elif self == BackendType.PROCESS:
+            return "process"
+        else:
+            raise ValueError(f"Unhandled `BackendType`: {self}")
+
+
 class ConnectionQuality:
     def __init__(self, loss: float, delay: float, rate: float) -> None:
         self.loss = loss
@@ -1,8 +1,8 @@
+import hashlib
 import logging
 import os
 import shutil
 import subprocess
-import tempfile
 from pathlib import Path
 from typing import List, NamedTuple, Dict, FrozenSet
 
@@ -11,6 +11,24 @@ from simulation.networks import Node, NodeId
 
 log = logging.getLogger(__name__)
 
+BUILD_CACHE_DIRECTORY = Path(os.getcwd()) / ".simulation_builds"
+"""
+Builds are kept here between simulations, keyed on the source and
+`BuildArgs`, so that unchanged builds aren't rebuilt.
+"""
+
+SOURCE_PATHS = [
+    "Cargo.toml",
+    "Cargo.lock",
+    "build.rs",
+    "src",
+    "resources/proto",
+]
+"""The files and directories that a build depends on."""
+
+GENERATED_SOURCE_PATHS = ["src/data_transformer/proto_api.rs"]
+"""Files written into `SOURCE_PATHS` by `build.rs`, so not part of the key."""
+
 
 class BuildArgs(NamedTuple):
     additional_features: FrozenSet[str]
@@ -31,10 +49,14 @@ def create_builds(nodes: List[Node]) -> Dict[NodeId, Build]:
         for node in nodes
     )
 
-    build_args = set(node_to_args.values())
-    builds_to_directories = dict(
-        (args, __create_build(args)) for args in build_args
-    )
+    source_hash = __hash_source()
+    # Builds are made one at a time, as every build runs `build.rs`, which
+    # rewrites `GENERATED_SOURCE_PATHS` in the shared source tree. Cargo already
+    # uses every core within each build.
+    builds_to_directories = {
+        args: __get_build(args, source_hash)
+        for args in set(node_to_args.values())
+    }
 
     return {
         node_id: builds_to_directories[args]
@@ -42,11 +64,73 @@ def create_builds(nodes: List[Node]) -> Dict[NodeId, Build]:
     }
 
 
-def __create_build(args: BuildArgs) -> Build:
-    directory = Path(tempfile.mkdtemp())
-    log.debug(f"Made build directory at {directory}")
+def __get_build(args: BuildArgs, source_hash: str) -> Build:
+    """
+    Gets the build for `args` from the cache, building it if it isn't there.
+    """
+    key = __build_key(args, source_hash)
+    directory = BUILD_CACHE_DIRECTORY / key
+    build = Build(directory / "kipa_cli", directory / "kipa_daemon", key)
+    if directory.is_dir():
+        log.info(f"Using cached build {key} for {args}")
+        return build
+
+    log.info(f"Creating build {key} for {args}")
+    # Builds are made in a temporary directory, and moved into place once
+    # finished, so that failed builds aren't cached
+    partial_directory = BUILD_CACHE_DIRECTORY / f"{key}.partial"
+    if partial_directory.is_dir():
+        shutil.rmtree(str(partial_directory))
+    partial_directory.mkdir(parents=True)
+    __create_build(args, partial_directory)
+    partial_directory.rename(directory)
+    return build
+
+
+def __build_key(args: BuildArgs, source_hash: str) -> str:
+    hasher = hashlib.sha256(source_hash.encode())
+    hasher.update(__args_key(args).encode())
+    return hasher.hexdigest()[:16]
+
+
+def __args_key(args: BuildArgs) -> str:
+    features = " ".join(sorted(args.additional_features))
+    return (
+        f"features={features},"
+        f"clear_default_features={args.clear_default_features},"
+        f"debug={args.debug}"
+    )
+
 
-    build_command = ["cargo", "build"]
+def __hash_source() -> str:
+    hasher = hashlib.sha256()
+    for source_path in SOURCE_PATHS:
+        path = Path(source_path)
+        paths = sorted(path.rglob("*")) if path.is_dir() else [path]
+        for file_path in paths:
+            if not file_path.is_file() or (
+                str(file_path) in GENERATED_SOURCE_PATHS
+            ):
+                continue
+            hasher.update(str(file_path).encode())
+            hasher.update(file_path.read_bytes())
+    return hasher.hexdigest()
+
+
+def __create_build(args: BuildArgs, directory: Path) -> None:
+    # Target directories are only keyed on the arguments, so that cargo can
+    # build incrementally when the source changes
+    target_directory = (
+        BUILD_CACHE_DIRECTORY
+        / "targets"
+        / hashlib.sha256(__args_key(args).encode()).hexdigest()[:16]
+    )
+    build_command = [
+        "cargo",
+        "build",
+        "--target-dir",
+        str(target_directory),
+    ]
     if not args.debug:
         build_command += ["--release"]
     if args.clear_default_features:
@@ -60,18 +144,16 @@ def __create_build(args: BuildArgs) -> Build:
     assert build_process.returncode == 0, "KIPA build command failed"
 
     if args.debug:
-        binary_directory = Path("target/debug")
+        binary_directory = target_directory / "debug"
     else:
-        binary_directory = Path("target/release")
+        binary_directory = target_directory / "release"
 
     log.debug("Extracting daemon binary")
     daemon_path = binary_directory / "kipa_daemon"
     assert os.path.isfile(daemon_path)
-    shutil.copyfile(daemon_path, directory / "kipa_daemon")
+    shutil.copy(str(daemon_path), str(directory / "kipa_daemon"))
 
     log.debug("Extracting cli binary")
     cli_path = binary_directory / "kipa_cli"
     assert os.path.isfile(cli_path)
-    shutil.copyfile(cli_path, directory / "kipa_cli")
-
-    return Build(cli_path, daemon_path)
+    shutil.copy(str(cli_path), str(directory / "kipa_cli"))
@@ -1,12 +1,12 @@
 import logging
 import multiprocessing
 from pathlib import Path
-from typing import Dict, Tuple, Any
+from typing import Dict, Tuple, Any, Optional
 
 import yaml
 
-from simulation.backends import DockerBackend
-from simulation.networks import Network
+from simulation.backends import Backend, DockerBackend, ProcessBackend
+from simulation.networks import Network, BackendType
 from simulation.operations import (
     create_builds,
     draw_main_graph,
@@ -21,15 +21,47 @@ from simulation.operations import get_logs, write_logs
 log = logging.getLogger(__name__)
 
 
-def simulate(network: Network, output_directory: Path) -> TestResult:
+def simulate(
+    network: Network,
+    output_directory: Path,
+    backend: Optional[Backend] = None,
+    reset: bool = True,
+) -> TestResult:
+    """
+    Simulates `network`. If `backend` is given, its network is reset and
+    reused rather than created from scratch, and it isn't cleaned up after.
+    `reset` can be false if `backend` was just started with `network`, so it
+    doesn't need resetting.
+    """
+    if backend is None:
+        simulation_backend = start_backend(network)
+    else:
+        simulation_backend = backend
+        if reset:
+            log.info("Resetting backend")
+            if not backend.reset_network(network):
+                log.info("Backend can't be reset, so reinitializing it")
+                __initialize_backend(backend, network)
+    test_results = __simulate(network, output_directory, simulation_backend)
+    if backend is None:
+        simulation_backend.clean()
+    return test_results
+
+
+def start_backend(network: Network) -> Backend:
+    """
+    Starts a backend with `network` initialized on it, to be given to
+    `simulate`.
+    """
     log.info("Starting backend")
-    backend = DockerBackend(network.num_threads)
-    backend.clean()
+    backend = __create_backend(network)
+    __initialize_backend(backend, network)
+    return backend
 
-    log.info("Building and initializing network")
-    node_builds = create_builds(network.nodes)
-    backend.initialize_network(network, node_builds)
 
+def __simulate(
+    network: Network, output_directory: Path, backend: Backend
+) -> TestResult:
     log.info("Connecting network together")
     connect_network(network, backend)
 
@@ -41,9 +73,8 @@ def simulate(network: Network, output_directory: Path) -> TestResult:
     log.info("Running tests on network")
     test_results = sample_test_searches(network, backend, network.num_searches)
 
-    log.info("Getting logs and cleaning up backend")
+    log.info("Getting logs")
     logs = get_logs(network, backend)
-    backend.clean()
 
     log.info("Creating search graphs")
     main_graph_path, query_graph_paths = __write_graphs(
@@ -60,6 +91,31 @@ def simulate(network: Network, output_directory: Path) -> TestResult:
     return test_results
 
 
+def __initialize_backend(backend: Backend, network: Network) -> None:
+    backend.clean()
+
+    log.info("Building and initializing network")
+    node_builds = create_builds(network.nodes)
+    backend.initialize_network(network, node_builds)
+
+
+def __create_backend(network: Network) -> Backend:
+    if network.backend == BackendType.DOCKER:
+        if network.startup_concurrency is not None:
+            return DockerBackend(
+                network.num_threads, network.startup_concurrency
+            )
+        return DockerBackend(network.num_threads)
+    elif network.backend == BackendType.PROCESS:
+        if network.startup_concurrency is not None:
+            return ProcessBackend(
+                network.num_threads, network.startup_concurrency
+            )
+        return ProcessBackend(network.num_threads)
+    else:
+        raise ValueError(f"Unhandled `BackendType`: {network.backend}")
+
+
 def __write_graphs(
     results: TestResult, logs: NetworkLogs, output_directory: Path
 ) -> Tuple[Path, Dict[str, Path]]:
@@ -0,0 +1,168 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from typing import List, Sequence
+from unittest import mock
+
+from simulation.networks import Node, NodeId
+from simulation.operations import builder
+
+_HASH_SOURCE = getattr(builder, "__hash_source")
+"""The real source hash, as the tests replace it with a fixed hash."""
+
+
+def _create_node(
+    key_id: str,
+    additional_features: Sequence[str] = (),
+    clear_default_features: bool = False,
+    debug: bool = False,
+) -> Node:
+    return Node(
+        NodeId(key_id),
+        {},
+        frozenset(additional_features),
+        clear_default_features,
+        False,
+        debug,
+    )
+
+
+class TestBuildCache(unittest.TestCase):
+    """
+    Creates builds with a fake `cargo`, so that nothing is compiled.
+    """
+
+    def setUp(self):
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.directory = Path(temporary_directory.name)
+
+        self.source_hash = "source"
+        self.cargo_commands: List[List[str]] = []
+        self.cargo_return_code = 0
+        for patcher in [
+            mock.patch.object(
+                builder, "BUILD_CACHE_DIRECTORY", self.directory / "builds"
+            ),
+            mock.patch.object(
+                builder, "__hash_source", lambda: self.source_hash
+            ),
+            mock.patch.object(builder.subprocess, "Popen", self.__cargo),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_cache_hit_skips_cargo(self):
+        build = builder.create_builds([_create_node("A")])[NodeId("A")]
+        self.assertEqual(len(self.cargo_commands), 1)
+        self.assertEqual(build.daemon_path.read_text(), "kipa_daemon")
+        self.assertEqual(build.cli_path.read_text(), "kipa_cli")
+
+        cached_build = builder.create_builds([_create_node("B")])[NodeId("B")]
+        self.assertEqual(len(self.cargo_commands), 1)
+        self.assertEqual(cached_build, build)
+
+    def test_nodes_share_builds(self):
+        builds = builder.create_builds(
+            [
+                _create_node("A"),
+                _create_node("B"),
+                _create_node("C", debug=True),
+            ]
+        )
+
+        self.assertEqual(len(self.cargo_commands), 2)
+        self.assertEqual(builds[NodeId("A")], builds[NodeId("B")])
+        self.assertNotEqual(builds[NodeId("A")], builds[NodeId("C")])
+
+    def test_key_changes_with_source_hash(self):
+        build = builder.create_builds([_create_node("A")])[NodeId("A")]
+        self.source_hash = "changed source"
+        changed_build = builder.create_builds([_create_node("A")])[NodeId("A")]
+
+        self.assertNotEqual(changed_build.key, build.key)
+        self.assertEqual(len(self.cargo_commands), 2)
+        # Builds of the same arguments share a target directory, so that cargo
+        # can build incrementally
+        self.assertEqual(
+            self.__arg(self.cargo_commands[0], "--target-dir"),
+            self.__arg(self.cargo_commands[1], "--target-dir"),
+        )
+
+    def test_key_changes_with_build_args(self):
+        nodes = [
+            _create_node("A"),
+            _create_node("B", additional_features=["x"]),
+            _create_node("C", additional_features=["x", "y"]),
+            _create_node("D", clear_default_features=True),
+            _create_node("E", debug=True),
+        ]
+        builds = builder.create_builds(nodes)
+
+        keys = {builds[node.id].key for node in nodes}
+        self.assertEqual(len(keys), len(nodes))
+        self.assertEqual(len(self.cargo_commands), len(nodes))
+        target_directories = {
+            self.__arg(command, "--target-dir")
+            for command in self.cargo_commands
+        }
+        self.assertEqual(len(target_directories), len(nodes))
+
+    def test_failed_builds_are_not_cached(self):
+        self.cargo_return_code = 1
+        with self.assertRaises(AssertionError):
+            builder.create_builds([_create_node("A")])
+
+        self.cargo_return_code = 0
+        build = builder.create_builds([_create_node("A")])[NodeId("A")]
+
+        self.assertEqual(len(self.cargo_commands), 2)
+        self.assertTrue(build.daemon_path.is_file())
+        self.assertEqual(
+            sorted(
+                path.name for path in (self.directory / "builds").iterdir()
+            ),
+            sorted(["targets", build.key]),
+        )
+
+    def test_source_hash(self):
+        source_directory = self.directory / "source"
+        for source_path in [
+            "Cargo.toml",
+            "Cargo.lock",
+            "build.rs",
+            "src/main.rs",
+            "resources/proto/api.proto",
+            *builder.GENERATED_SOURCE_PATHS,
+        ]:
+            (source_directory / source_path).parent.mkdir(
+                parents=True, exist_ok=True
+            )
+            (source_directory / source_path).write_text(source_path)
+
+        working_directory = os.getcwd()
+        os.chdir(str(source_directory))
+        self.addCleanup(os.chdir, working_directory)
+        source_hash = _HASH_SOURCE()
+
+        Path(builder.GENERATED_SOURCE_PATHS[0]).write_text("generated")
+        self.assertEqual(_HASH_SOURCE(), source_hash)
+
+        Path("src/main.rs").write_text("changed")
+        self.assertNotEqual(_HASH_SOURCE(), source_hash)
+
+    def __cargo(self, command: List[str]) -> mock.Mock:
+        self.assertEqual(command[:2], ["cargo", "build"])
+        self.cargo_commands.append(command)
+        binary_directory = Path(self.__arg(command, "--target-dir")) / (
+            "release" if "--release" in command else "debug"
+        )
+        binary_directory.mkdir(parents=True, exist_ok=True)
+        for binary in ["kipa_daemon", "kipa_cli"]:
+            (binary_directory / binary).write_text(binary)
+        return mock.Mock(returncode=self.cargo_return_code)
+
+    @staticmethod
+    def __arg(args: List[str], name: str) -> str:
+        return args[args.index(name) + 1]
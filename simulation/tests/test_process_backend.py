@@ -0,0 +1,241 @@
+import os
+import signal
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from typing import List
+from unittest import mock
+
+from simulation import Build
+from simulation.backends import CliCommand, process_backend
+from simulation.backends.backend import READY_LOG_MESSAGES
+from simulation.backends.process_backend import ProcessBackend
+from simulation.networks import (
+    Network,
+    Node,
+    NodeId,
+    ConnectType,
+    BackendType,
+)
+
+_POPEN = subprocess.Popen
+"""The real `Popen`, as the tests replace it with fake daemons."""
+
+BUILD = Build(Path("/kipa/kipa_cli"), Path("/kipa/kipa_daemon"), "key")
+
+
+def _create_network(num_nodes: int, ipv6: bool) -> Network:
+    return Network(
+        [
+            Node(NodeId(f"{index:08X}"), {}, frozenset(), False, False, False)
+            for index in range(num_nodes)
+        ],
+        ipv6,
+        1,
+        1,
+        ConnectType.CYCLICAL,
+        None,
+        1,
+        BackendType.PROCESS,
+        None,
+    )
+
+
+class TestProcessBackend(unittest.TestCase):
+    """
+    Runs `ProcessBackend` with fake daemon and CLI processes, so that no builds
+    are needed.
+    """
+
+    def setUp(self):
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.directory = Path(temporary_directory.name) / "kipa_simulation"
+
+        self.daemons: List[mock.Mock] = []
+        self.daemon_args: List[List[str]] = []
+        self.cli_args: List[List[str]] = []
+        for patcher in [
+            mock.patch.object(
+                process_backend, "PROCESS_DIRECTORY", self.directory
+            ),
+            mock.patch.object(
+                process_backend, "has_startup_memory", return_value=True
+            ),
+            mock.patch.object(
+                process_backend.subprocess, "Popen", self.__start_daemon
+            ),
+            mock.patch.object(
+                process_backend.asyncio,
+                "create_subprocess_exec",
+                self.__run_cli,
+            ),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.backend = ProcessBackend(max_commands=10)
+        self.addCleanup(self.backend.loop.close)
+
+    def test_ip_addresses(self):
+        network = _create_network(3, ipv6=False)
+        self.__initialize(network)
+
+        self.assertEqual(
+            [self.backend.get_ip_address(node.id) for node in network.nodes],
+            ["127.0.0.1:10842", "127.0.0.1:10843", "127.0.0.1:10844"],
+        )
+        self.assertEqual(
+            [self.__arg(args, "--port") for args in self.daemon_args],
+            ["10842", "10843", "10844"],
+        )
+        self.assertEqual(
+            {self.__arg(args, "--force-ipv6") for args in self.daemon_args},
+            {"false"},
+        )
+
+    def test_ipv6_addresses(self):
+        network = _create_network(2, ipv6=True)
+        self.__initialize(network)
+
+        self.assertEqual(
+            [self.backend.get_ip_address(node.id) for node in network.nodes],
+            ["[::1]:10842", "[::1]:10843"],
+        )
+        self.assertEqual(
+            {self.__arg(args, "--force-ipv6") for args in self.daemon_args},
+            {"true"},
+        )
+
+    def test_node_directories(self):
+        network = _create_network(2, ipv6=False)
+        self.__initialize(network)
+
+        for node, args, daemon in zip(
+            network.nodes, self.daemon_args, self.daemons
+        ):
+            node_directory = self.directory / node.key_id()
+            self.assertEqual(
+                (node_directory / "secret.txt").read_text(),
+                process_backend.SECRET,
+            )
+            self.assertEqual(
+                (node_directory / "daemon.pid").read_text(), str(daemon.pid)
+            )
+            self.assertTrue((node_directory / "daemon.log").is_file())
+            self.assertEqual(
+                self.__arg(args, "--socket-path"),
+                str(node_directory / "kipa.sock"),
+            )
+
+        node = network.nodes[1]
+        node_directory = self.directory / node.key_id()
+        results = self.backend.run_commands(
+            [CliCommand(node.id, ["search", "1234"])] * 2
+        )
+
+        self.assertEqual([r.successful() for r in results], [True, True])
+        self.assertEqual(
+            [self.__arg(args, "--socket-path") for args in self.cli_args],
+            [str(node_directory / "kipa.sock")] * 2,
+        )
+        # Each command logs to its own directory, so that they don't clash
+        log_directories = {
+            self.__arg(args, "--log-directory") for args in self.cli_args
+        }
+        self.assertEqual(
+            log_directories,
+            {
+                str(node_directory / "cli_logs" / "0"),
+                str(node_directory / "cli_logs" / "1"),
+            },
+        )
+        self.assertEqual(
+            [
+                cli_log["search"]
+                for cli_log in self.backend.get_cli_logs(node.id)
+            ],
+            ["1234", "1234"],
+        )
+
+    def test_stop_networking(self):
+        network = _create_network(2, ipv6=False)
+        self.__initialize(network)
+        stopped, running = self.daemons
+
+        self.backend.stop_networking(network.nodes[0].id)
+        stopped.send_signal.assert_called_once_with(signal.SIGSTOP)
+
+        self.backend.run_commands([CliCommand(network.nodes[0].id, ["list"])])
+        self.assertEqual(
+            stopped.send_signal.call_args_list,
+            [mock.call(signal.SIGSTOP), mock.call(signal.SIGCONT)],
+        )
+
+        # Resumed nodes aren't resumed again
+        self.backend.run_commands(
+            [CliCommand(node.id, ["list"]) for node in network.nodes]
+        )
+        self.assertEqual(stopped.send_signal.call_count, 2)
+        running.send_signal.assert_not_called()
+
+    @unittest.skipUnless(
+        os.path.isdir("/proc/self"), "Checking daemon PIDs needs /proc"
+    )
+    def test_clean_kills_stale_daemons(self):
+        # Real processes are needed, as `/proc` is read to check that a PID is
+        # still a daemon
+        stale_daemon = _POPEN(["/kipa/kipa_daemon", "60"], executable="sleep")
+        self.addCleanup(self.__kill, stale_daemon)
+        other_process = _POPEN(["sleep", "60"])
+        self.addCleanup(self.__kill, other_process)
+        for name, pid in [
+            ("stale", stale_daemon.pid),
+            ("reused", other_process.pid),
+        ]:
+            (self.directory / name).mkdir(parents=True)
+            (self.directory / name / "daemon.pid").write_text(str(pid))
+
+        self.backend.clean()
+
+        self.assertEqual(stale_daemon.wait(timeout=10), -signal.SIGKILL)
+        self.assertIsNone(other_process.poll())
+        self.assertFalse(self.directory.exists())
+
+    def __initialize(self, network: Network) -> None:
+        self.backend.initialize_network(
+            network, {node.id: BUILD for node in network.nodes}
+        )
+
+    def __start_daemon(self, args: List[str], **kwargs) -> mock.Mock:
+        self.daemon_args.append(args)
+        kwargs["stdout"].write(b"\n".join(READY_LOG_MESSAGES))
+        kwargs["stdout"].flush()
+        daemon = mock.Mock(pid=1000 + len(self.daemons))
+        daemon.poll.return_value = None
+        self.daemons.append(daemon)
+        return daemon
+
+    async def __run_cli(self, *args: str, **_) -> mock.Mock:
+        self.cli_args.append(list(args))
+        log_directory = Path(self.__arg(args, "--log-directory"))
+        log_directory.mkdir(parents=True)
+        (log_directory / "log-cli.json").write_text(
+            f'{{"search": "{args[-1]}"}}\n'
+        )
+
+        async def communicate():
+            return b"output", None
+
+        return mock.Mock(returncode=0, communicate=communicate)
+
+    @staticmethod
+    def __arg(args: List[str], name: str) -> str:
+        return args[list(args).index(name) + 1]
+
+    @staticmethod
+    def __kill(process: subprocess.Popen) -> None:
+        if process.poll() is None:
+            process.kill()
+            process.wait()